@@ -1,12 +1,16 @@
+import os
 import sys
 import argparse
 import asyncio
+import contextlib
 
 from .__init__ import __version__
-from .cache import delete_from_cache, list_cache
+from .cache import delete_from_cache, list_cache, compress_cache, probe_cache, probe_misses, search_cache
 from .webster import search_webster, get_webster_wod, get_webster_wod_list
-from .camb import search_cambridge
-from .utils import get_cache_selection, get_cache_selection_by_fzf
+from .log import logger
+from .config import WARM_CONCURRENCY
+from .utils import get_cache_selection, get_cache_selection_by_fzf, start_warm_up, OP, DICT, FetchError
+from . import camb, webster
 
 
 def parse_args(session):
@@ -65,6 +69,21 @@ def parse_args(session):
         help="randomly list 20 words/phrases you've found before",
     )
 
+    # Add an optional argument for l command
+    parser_lw.add_argument(
+        "-g",
+        "--grep",
+        nargs="+",
+        help="list words/phrases whose cached definitions or examples contain all the given words, best matches first",
+    )
+
+    # Add an optional argument for l command
+    parser_lw.add_argument(
+        "--compress",
+        action="store_true",
+        help="compress the entries cached by older versions and shrink the cache file",
+    )
+
     # Add sub-command s
     parser_sw = sub_parsers.add_parser("s", help="look up words/phrases; hidden for convenience, no need to type")
 
@@ -103,6 +122,22 @@ def parse_args(session):
         help="look up words/phrases afresh without using cache",
     )
 
+    # Add an optional argument for s command
+    parser_sw.add_argument(
+        "-r",
+        "--revalidate",
+        action="store_true",
+        help="print cached words/phrases at once, and fetch them again in the background if they are outdated",
+    )
+
+
+    # Add an optional argument for s command
+    parser_sw.add_argument(
+        "-H",
+        "--hedge",
+        action="store_true",
+        help="look up words/phrases in Merriam-Webster Dictionary as well if Cambridge Dictionary is slow to answer, printing whichever comes first",
+    )
 
     # Add an optional argument for s command
     parser_sw.add_argument(
@@ -129,18 +164,72 @@ def parse_args(session):
         help="list all words of the day",
     )
 
+    # Add sub-command warm
+    parser_warm = sub_parsers.add_parser(
+        "warm",
+        help="fetch and cache words/phrases listed one per line in a file, without printing them",
+    )
+
+    # Make sub-command warm run default function of "warm_words"
+    parser_warm.set_defaults(func=warm_words)
+
+    # Add an optional argument for warm command
+    parser_warm.add_argument(
+        "--file",
+        required=True,
+        help="the file listing words/phrases one per line, - for stdin",
+    )
+
+    # Add an optional argument for warm command
+    parser_warm.add_argument(
+        "-w",
+        "--webster",
+        action="store_true",
+        help="cache the words/phrases from Merriam-Webster Dictionary",
+    )
+
+    # Add an optional argument for warm command
+    parser_warm.add_argument(
+        "-c",
+        "--chinese",
+        action="store_true",
+        help="cache the words/phrases from Cambridge Dictionary with Chinese translation",
+    )
+
+    # Add an optional argument for warm command, also taken after it; suppressed, so it doesn't reset a --debug given before it
+    parser_warm.add_argument(
+        "--debug",
+        action="store_true",
+        default=argparse.SUPPRESS,
+        help="turn on debug mode",
+    )
+
+    # Add an optional argument for warm command
+    parser_warm.add_argument(
+        "-j",
+        "--jobs",
+        type=int,
+        default=WARM_CONCURRENCY,
+        help=f"fetch this many words/phrases at a time, {WARM_CONCURRENCY} by default",
+    )
+
     if len(sys.argv) == 1:
-        print_help(parser, parser_lw, parser_sw, parser_wod)
+        print_help(parser, parser_lw, parser_sw, parser_wod, parser_warm)
         sys.exit()
 
     elif sys.argv[1] == "-h" or sys.argv[1] == "--help":
-        print_help(parser, parser_lw, parser_sw, parser_wod)
+        print_help(parser, parser_lw, parser_sw, parser_wod, parser_warm)
         sys.exit()
 
     elif sys.argv[1] == "-v" or sys.argv[1] == "--version":
         print("cambridge " + __version__)
         sys.exit()
 
+    # "camb warm" without --file still looks up the word "warm", whatever stdin is
+    elif "warm" in sys.argv[1 : ] and any(i == "--file" or i.startswith("--file=") for i in sys.argv[1 : ]):
+        args = parser.parse_args()
+        return args
+
     elif "l" in sys.argv[1 : ] or "wod" in sys.argv[1 : ]:
         args = parser.parse_args()
         return args
@@ -171,6 +260,10 @@ def parse_args(session):
                 parser_sw.set_defaults(fresh=True)
             elif word == "--nosuggestions" or word == "-n":
                 parser_sw.set_defaults(nosuggestions=True)
+            elif word == "--revalidate" or word == "-r":
+                parser_sw.set_defaults(revalidate=True)
+            elif word == "--hedge" or word == "-H":
+                parser_sw.set_defaults(hedge=True)
             elif (word == "--search" or word == "-s") and (index == len(argv_list) - 1):
                 continue
             elif (word == "--webster" or word == "-w") and (index == len(argv_list) - 1):
@@ -185,7 +278,14 @@ def parse_args(session):
         return args
 
 
-def print_help(parser, parser_lw, parser_sw, parser_wod):
+def warm_up_dicts(session, dict_names):
+    """Connect to the dictionaries the cache misses are going to be fetched from, while the rest of the lookup goes on."""
+
+    for dict_name in dict.fromkeys(dict_names):
+        start_warm_up(session, camb.CAMBRIDGE_URL if dict_name == DICT.CAMBRIDGE.name else webster.WEBSTER_BASE_URL)
+
+
+def print_help(parser, parser_lw, parser_sw, parser_wod, parser_warm):
     parser.print_help()
     print("\n\n\033[1mCOMMAND l\033[0m")
     parser_lw.print_help()
@@ -196,6 +296,9 @@ def print_help(parser, parser_lw, parser_sw, parser_wod):
     print("\n\n\033[1mCOMMAND wod\033[0m")
     parser_wod.print_help()
 
+    print("\n\n\033[1mCOMMAND warm\033[0m")
+    parser_warm.print_help()
+
     sys.exit()
 
 
@@ -211,14 +314,23 @@ async def list_words(args):
         await asyncio.gather(*tasks)
         return
 
-    if args.random:
+    if args.compress:
+        await compress_cache()
+        return
+
+    if args.grep:
+        method = "grep"
+    elif args.random:
         method = "random"
     elif args.time:
         method = "by_time"
     else:
         method = "by_alpha"
 
-    has_fzf, data = list_cache(method)
+    if args.grep:
+        has_fzf, data = await search_cache(" ".join(args.grep))
+    else:
+        has_fzf, data = await list_cache(method)
     select_word = get_cache_selection_by_fzf(data) if has_fzf else get_cache_selection(data, method)
 
     if len(select_word) > 1 and not select_word.isnumeric():
@@ -232,31 +344,138 @@ async def search_word(args):
         print("You didn't input any word or phrase.")
         sys.exit(3)
 
-    tasks = []
+    lookups = [] # (dict_name, word, is_ch)
     if args.search:
         cambridge_words = " ".join(args.search)
         for w in cambridge_words.split(","):
             i = w.strip(".").strip()
             if i:
-                tasks.append(search_cambridge(args.session, i, args.fresh, False, args.nosuggestions, None))
+                lookups.append((DICT.CAMBRIDGE.name, i, False))
     if args.webster:
         webster_words = " ".join(args.webster)
         for w in webster_words.split(","):
             i = w.strip(".").strip()
             if i:
-                tasks.append(search_webster(args.session, i, args.fresh, args.nosuggestions, None))
+                lookups.append((DICT.MERRIAM_WEBSTER.name, i, False))
     if args.chinese:
         words = " ".join(args.chinese)
         for w in words.split(","):
             i = w.strip(".").strip()
             if i:
-                tasks.append(search_cambridge(args.session, i, args.fresh, True, args.nosuggestions, None))
+                lookups.append((DICT.CAMBRIDGE.name, i, True))
+
+    req_urls = [camb.get_search_url(i, is_ch) if dict_name == DICT.CAMBRIDGE.name else webster.get_search_url(i) for dict_name, i, is_ch in lookups]
+
+    # Resolve all the words in one cache query, then send only the misses to the network
+    res_urls = await probe_cache([(i, req_url) for (_, i, _), req_url in zip(lookups, req_urls)])
+
+    # Only the dictionaries with misses are connected to, a run answered all from the cache makes no request
+    warm_up_dicts(args.session, [dict_name for (dict_name, _, _), res_url in zip(lookups, res_urls) if res_url is None or args.fresh])
+
+    # Fetching afresh still sends the validators of the cached pages, so unchanged ones need no download
+    cached_urls = [None] * len(lookups)
+    if args.fresh:
+        cached_urls, res_urls = res_urls, cached_urls
+
+    # Words not found lately are answered with their cached suggestions, again in one query
+    if args.fresh:
+        suggestion_lists = [None] * len(lookups)
+    else:
+        suggestion_lists = await probe_misses([req_url if res_url is None else None for req_url, res_url in zip(req_urls, res_urls)])
+
+    tasks = []
+    for (dict_name, i, is_ch), req_url, res_url, suggestions, cached_url in zip(lookups, req_urls, res_urls, suggestion_lists, cached_urls):
+        if res_url is not None:
+            continue
+        logger.debug(f'{OP.NOT_FOUND.name} "{i}" in cache')
+        if suggestions is not None:
+            logger.debug(f'{OP.FOUND.name} the suggestions for "{i}" in cache')
+            run = camb.suggestion_run if dict_name == DICT.CAMBRIDGE.name else webster.suggestion_run
+            tasks.append(asyncio.create_task(run(args.session, i, args.nosuggestions, suggestions)))
+        elif dict_name == DICT.CAMBRIDGE.name and args.hedge and not is_ch and cached_url is None:
+            tasks.append(asyncio.create_task(camb.hedged_run(args.session, i, args.nosuggestions, req_url)))
+        elif dict_name == DICT.CAMBRIDGE.name:
+            tasks.append(asyncio.create_task(camb.fresh_run(args.session, i, is_ch, args.nosuggestions, req_url, cached_url)))
+        else:
+            tasks.append(asyncio.create_task(webster.fresh_run(args.session, i, args.nosuggestions, req_url, cached_url)))
+
+    # The misses are on their way, meanwhile print the hits
+    session = args.session if args.revalidate else None
+    for res_url in res_urls:
+        if res_url is None:
+            continue
+        if DICT.CAMBRIDGE.name.lower() in res_url:
+            await camb.cache_run(res_url, session)
+        else:
+            await webster.cache_run(res_url, session)
 
     await asyncio.gather(*tasks)
 
 
-async def wod(args):
-    if args.list:
-        await get_webster_wod_list(args.session)
+async def warm_words(args):
+    if args.file == "-":
+        lines = sys.stdin.readlines()
     else:
-        await get_webster_wod(args.session)
+        try:
+            with open(args.file, encoding="utf-8") as f:
+                lines = f.readlines()
+        except OSError as error:
+            print(f'Reading <{args.file}> failed: [{error.__class__.__name__}] {error}')
+            sys.exit(3)
+
+    words = list(dict.fromkeys(i.strip() for i in lines if i.strip()))
+    if not words:
+        print("You didn't input any word or phrase.")
+        sys.exit(3)
+
+    if args.webster:
+        req_urls = [webster.get_search_url(i) for i in words]
+    else:
+        req_urls = [camb.get_search_url(i, args.chinese) for i in words]
+
+    # The cache is the checkpoint: words cached, or found missing lately, by an earlier run are skipped, so an interrupted warm-up resumes where it stopped
+    res_urls = await probe_cache(list(zip(words, req_urls)))
+    if None in res_urls:
+        warm_up_dicts(args.session, [DICT.MERRIAM_WEBSTER.name if args.webster else DICT.CAMBRIDGE.name])
+    suggestion_lists = await probe_misses([req_url if res_url is None else None for req_url, res_url in zip(req_urls, res_urls)])
+    todo = [(i, req_url) for i, req_url, res_url, suggestions in zip(words, req_urls, res_urls, suggestion_lists) if res_url is None and suggestions is None]
+    print(f"{len(words) - len(todo)} of {len(words)} words/phrases cached before", file=sys.stderr)
+
+    semaphore = asyncio.Semaphore(max(args.jobs, 1))
+    done = 0
+    failed = []
+
+    async def warm_word(word, req_url):
+        nonlocal done
+        async with semaphore:
+            try:
+                if args.webster:
+                    await webster.fresh_lookup(args.session, word, True, req_url)
+                else:
+                    await camb.fresh_lookup(args.session, word, args.chinese, True, req_url)
+            # Not found, or fetching failed
+            except (SystemExit, FetchError):
+                failed.append(word)
+
+            done += 1
+            print(f"\r{done}/{len(todo)} fetched, {len(failed)} not found or failed", end="", file=sys.stderr, flush=True)
+
+    # Only the parsed entries are wanted, not their printing
+    with open(os.devnull, "w") as devnull, contextlib.redirect_stdout(devnull):
+        await asyncio.gather(*[warm_word(i, req_url) for i, req_url in todo])
+
+    if todo:
+        print(file=sys.stderr)
+    for i in failed:
+        logger.debug(f'{OP.CANCELLED.name} caching "{i}"')
+
+
+async def wod(args):
+    try:
+        if args.list:
+            await get_webster_wod_list(args.session)
+        else:
+            await get_webster_wod(args.session)
+    except FetchError as error:
+        print(error)
+        sys.exit(2)
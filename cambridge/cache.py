@@ -1,21 +1,59 @@
+import os
 import sys
+import json
+import zlib
 import sqlite3
+import random
+import asyncio
+import datetime
+import functools
+import itertools
 from pathlib import Path
+from concurrent.futures import ThreadPoolExecutor
 
 from .log import logger
 from .utils import OP, has_tool, get_dict_name_by_url
+from .config import CACHE_MAX_ENTRIES, CACHE_MAX_MB, CACHE_EVICTION, CACHE_BATCH_SIZE, CACHE_FLUSH_SECONDS, CACHE_MISS_TTL_HOURS, CACHE_STALE_HOURS
 
 dir = Path.home() / ".cache" / "cambridge"
 dir.mkdir(parents=True, exist_ok=True)
 DB = str(dir / "cambridge.db")
 
-con = sqlite3.connect(DB, detect_types=sqlite3.PARSE_DECLTYPES | sqlite3.PARSE_COLNAMES)
+# Wait up to this many seconds for another camb process holding the write lock, instead of failing with "database is locked"
+BUSY_TIMEOUT = 10
+
+# All DB work runs on this one thread: sqlite calls don't block the event loop fetching other words, and never overlap on the connection
+executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="cambridge-db")
+
+con = sqlite3.connect(DB, timeout=BUSY_TIMEOUT, check_same_thread=False, detect_types=sqlite3.PARSE_DECLTYPES | sqlite3.PARSE_COLNAMES)
+
+# Only takes effect on a new database, or on an old one after VACUUM, e.g. `camb l --compress`
+con.execute("PRAGMA auto_vacuum = INCREMENTAL")
+
+# In WAL mode readers never wait for a writer, so parallel camb processes only serialise on writes
+con.execute("PRAGMA journal_mode = WAL")
+con.execute("PRAGMA synchronous = NORMAL")
 
 
 # NOTE Python sqslite3 syntax suger is bitter.
 
 # The following functions suffixed with _table are simply DB operations and not complicated by higher level business logics
-# The following functions suffixed with _cache are wrappers of functions suffixed with _table
+# The following functions suffixed with _cache are wrappers of functions suffixed with _table, running them on the DB thread by run_in_db()
+
+
+async def run_in_db(func, *args):
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(executor, functools.partial(func, *args))
+
+
+pending_entries = []    # entries saved by save_to_cache() and not written yet
+flush_timer = None
+flush_tasks = set()     # hold references to the running flush tasks, or they may be garbage collected
+
+
+def close():
+    executor.submit(con.close).result()
+    executor.shutdown()
 
 
 def create_table():
@@ -26,12 +64,189 @@ def create_table():
         "created_at" TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
         "response_url" TEXT UNIQUE NOT NULL,
         "response_text" TEXT NOT NULL,
+        "response_entry" TEXT,
         UNIQUE(response_url))"""
     )
 
 
-def insert_entry_into_table(input_word, response_word, url, text):
-    import datetime
+def add_entry_column():
+    # Tables created before the parsed entry model existed only hold the html
+    columns = [row[1] for row in con.execute("PRAGMA table_info(words)")]
+    if "response_entry" not in columns:
+        con.execute("ALTER TABLE words ADD COLUMN response_entry TEXT")
+
+
+def create_word_indexes():
+    # response_url is already indexed by its UNIQUE constraint
+    con.execute("CREATE INDEX IF NOT EXISTS words_input_word ON words (input_word)")
+    con.execute("CREATE INDEX IF NOT EXISTS words_response_word ON words (response_word)")
+
+
+def create_alias_table():
+    # Every input word that has ever resolved to a page, e.g. "ran", "running" and "run" all pointing at the page of "run"
+    con.execute(
+        """CREATE TABLE IF NOT EXISTS aliases (
+        "input_word" TEXT NOT NULL,
+        "response_url" TEXT NOT NULL,
+        PRIMARY KEY (input_word, response_url))"""
+    )
+    con.execute("CREATE INDEX IF NOT EXISTS aliases_response_url ON aliases (response_url)")
+    con.execute("INSERT OR IGNORE INTO aliases (input_word, response_url) SELECT input_word, response_url FROM words")
+
+
+def add_access_tracking():
+    con.execute("ALTER TABLE words ADD COLUMN last_accessed TIMESTAMP")
+    con.execute("ALTER TABLE words ADD COLUMN hits INTEGER NOT NULL DEFAULT 0")
+    con.execute("UPDATE words SET last_accessed = created_at")
+    con.execute("CREATE INDEX IF NOT EXISTS words_last_accessed ON words (last_accessed)")
+    con.execute("CREATE INDEX IF NOT EXISTS words_hits ON words (hits, last_accessed)")
+
+    # Keep the number of entries up to date with triggers, so checking the budget doesn't count the whole table
+    con.execute('CREATE TABLE IF NOT EXISTS stats ("name" TEXT PRIMARY KEY, "value" INTEGER NOT NULL)')
+    con.execute("INSERT OR REPLACE INTO stats (name, value) SELECT 'entries', count(*) FROM words")
+    con.execute("CREATE TRIGGER IF NOT EXISTS words_count_insert AFTER INSERT ON words BEGIN UPDATE stats SET value = value + 1 WHERE name = 'entries'; END")
+    con.execute("CREATE TRIGGER IF NOT EXISTS words_count_delete AFTER DELETE ON words BEGIN UPDATE stats SET value = value - 1 WHERE name = 'entries'; END")
+
+
+def create_inflection_table():
+    # Inflected forms pointing at the page of their lemma, e.g. "ran", "mice", "better"
+    con.execute(
+        """CREATE TABLE IF NOT EXISTS inflections (
+        "form" TEXT NOT NULL,
+        "response_url" TEXT NOT NULL,
+        PRIMARY KEY (form, response_url))"""
+    )
+    con.execute("CREATE INDEX IF NOT EXISTS inflections_response_url ON inflections (response_url)")
+
+    # Only the forms the pages list, see get_word_forms()
+    for response_url, response_entry in con.execute("SELECT response_url, response_entry FROM words WHERE response_entry IS NOT NULL").fetchall():
+        insert_forms_into_table(response_url, get_word_forms(load_entry(response_entry)))
+
+
+def create_sense_index():
+    # Full-text index of the definitions and examples of every page, the rowid being the rowid of the page in words
+    con.execute(
+        """CREATE VIRTUAL TABLE IF NOT EXISTS senses USING fts5(
+        word, definitions, examples,
+        tokenize = 'porter unicode61')"""
+    )
+
+    for rowid, response_entry in con.execute("SELECT rowid, response_entry FROM words WHERE response_entry IS NOT NULL").fetchall():
+        insert_senses_into_table(rowid, load_entry(response_entry))
+
+
+def create_time_index():
+    con.execute("CREATE INDEX IF NOT EXISTS words_created_at ON words (created_at)")
+
+
+def create_miss_table():
+    # Words not found at a request url, with the suggestions offered instead, an empty list if none
+    con.execute("""CREATE TABLE IF NOT EXISTS misses (
+        "request_url" TEXT PRIMARY KEY,
+        "suggestions" BLOB NOT NULL,
+        "created_at" TIMESTAMP NOT NULL
+    )""")
+    con.execute("CREATE INDEX IF NOT EXISTS misses_created_at ON misses (created_at)")
+
+
+def add_validator_columns():
+    # ETag and Last-Modified of the page, sent back when it is fetched again so an unchanged page comes as a bodiless 304
+    con.execute("ALTER TABLE words ADD COLUMN etag TEXT")
+    con.execute("ALTER TABLE words ADD COLUMN last_modified TEXT")
+
+
+# Migration N brings the schema from version N - 1 to N, and the version reached is kept in PRAGMA user_version.
+# Only append new migrations; a database that has run one will never run it again.
+MIGRATIONS = [
+    create_table,
+    add_entry_column,
+    create_word_indexes,
+    create_alias_table,
+    add_access_tracking,
+    create_inflection_table,
+    create_sense_index,
+    create_time_index,
+    create_miss_table,
+    add_validator_columns,
+]
+
+
+def migrate():
+    # BEGIN IMMEDIATE takes the write lock before reading the version, so two processes can't both run the same migration.
+    con.execute("BEGIN IMMEDIATE")
+    try:
+        version = con.execute("PRAGMA user_version").fetchone()[0]
+        for migration in MIGRATIONS[version : ]:
+            logger.debug(f"{OP.UPDATED.name} cache schema with {migration.__name__}")
+            migration()
+        if version < len(MIGRATIONS):
+            con.execute(f"PRAGMA user_version = {len(MIGRATIONS)}")
+    except sqlite3.Error as error:
+        con.rollback()
+        logger.error(f'{OP.CANCELLED.name} upgrading cache at {DB}: [{error.__class__.__name__}] {error}\n')
+        sys.exit(4)
+    else:
+        con.commit()
+
+
+# Compressed values are stored as BLOBs starting with this marker, values written before compression existed are plain TEXT.
+COMPRESSION_MARKER = b"zlib:"
+
+
+def compress(text):
+    return COMPRESSION_MARKER + zlib.compress(text.encode("utf-8"))
+
+
+def decompress(value):
+    if isinstance(value, bytes) and value.startswith(COMPRESSION_MARKER):
+        return zlib.decompress(value[len(COMPRESSION_MARKER) : ]).decode("utf-8")
+    return value
+
+
+def dump_entry(entry):
+    return compress(json.dumps(entry, ensure_ascii=False, separators=(",", ":")))
+
+
+def load_entry(value):
+    return json.loads(decompress(value)) if value is not None else None
+
+
+def get_word_forms(entry):
+    """The inflected forms the page itself lists; regular ones are left to the stripping of "s" and "es" in probe_words_in_table()."""
+
+    forms = set()
+    if entry is None:
+        return forms
+
+    for e in entry["entries"]:
+        forms.update(i.replace("·", "").strip().lower() for i in e["inflections"])
+
+    forms.discard("")
+    return forms
+
+
+def insert_forms_into_table(url, forms):
+    con.executemany("INSERT OR IGNORE INTO inflections (form, response_url) VALUES (?, ?)", [(form, url) for form in forms])
+
+
+def insert_senses_into_table(rowid, entry):
+    senses = [sense for e in entry["entries"] for sense in e["senses"]]
+    definitions = "\n".join(sense["definition"] for sense in senses)
+    examples = "\n".join(example for sense in senses for example in sense["examples"])
+    con.execute("INSERT INTO senses (rowid, word, definitions, examples) VALUES (?, ?, ?, ?)", (rowid, entry["word"], definitions, examples))
+
+
+def delete_links_from_table(url, rowid):
+    """Delete what points at a deleted page."""
+
+    con.execute("DELETE FROM aliases WHERE response_url = ?", (url,))
+    con.execute("DELETE FROM inflections WHERE response_url = ?", (url,))
+    con.execute("DELETE FROM senses WHERE rowid = ?", (rowid,))
+
+
+def insert_entry_into_table(input_word, response_word, url, text, entry, validators=(None, None)):
+    """Insert one entry inside the caller's transaction, see insert_entries_into_table()."""
+
     current_datetime = datetime.datetime.now()
 
     try:
@@ -69,14 +284,21 @@ def insert_entry_into_table(input_word, response_word, url, text):
         )
         """
         res_word = con.execute(
-            """INSERT INTO words (input_word, response_word, created_at, response_url, response_text)
-            VALUES (?, ?, ?, ?, ?)
+            """INSERT INTO words (input_word, response_word, created_at, response_url, response_text, response_entry, last_accessed, etag, last_modified)
+            VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)
             ON CONFLICT DO NOTHING
-            RETURNING response_word
+            RETURNING response_word, rowid
             """,
-            (input_word, response_word, current_datetime, url, text)
+            (input_word, response_word, current_datetime, url, compress(text), dump_entry(entry), current_datetime, *validators)
         ).fetchone()
 
+        # The page may be cached already under another input word, remember this one too
+        con.execute("INSERT OR IGNORE INTO aliases (input_word, response_url) VALUES (?, ?)", (input_word, url))
+
+        if res_word is not None:
+            insert_forms_into_table(url, get_word_forms(entry))
+            insert_senses_into_table(res_word[1], entry)
+
     except sqlite3.OperationalError as error:
         if "no such table" in str(error):
             create_table()
@@ -85,15 +307,49 @@ def insert_entry_into_table(input_word, response_word, url, text):
     except sqlite3.Error:
         raise
     else:
-        con.commit()
         return res_word
 
 
-def check_word_in_table(word, request_url):
+def insert_entries_into_table(entries):
+    """Insert a batch of entries in one transaction, i.e. one fsync for the whole batch."""
+
+    try:
+        results = [insert_entry_into_table(*entry) for entry in entries]
+    except sqlite3.Error:
+        con.rollback()
+        raise
+    else:
+        con.commit()
+        return results
+
+
+def probe_words_in_table(lookups):
+    """Resolve a list of (word, request_url) in one query. Returns the cached response_url or None for each of them."""
+
+    if not lookups:
+        return []
+
+    params = []
+    for key, (word, request_url) in enumerate(lookups):
+        params.extend((key, word, request_url))
+    values = ", ".join(["(?, ?, ?)"] * len(lookups))
+
     try:
+        # One indexed join per column; an OR across the columns would scan the table instead.
+        # "branch" keeps the priority of the columns: request url, response word, input word, aliases, inflected forms,
+        # then the word without a trailing "s", then without a trailing "es", e.g. plural nouns and verbs in the third person.
         cur = con.execute(
-            "SELECT response_url FROM words WHERE response_url = ? OR response_word = ? OR input_word = ?",
-            (request_url, word, word),
+            f"""WITH q(key, word, url) AS (VALUES {values})
+            SELECT q.key, 0 AS branch, w.response_url FROM q JOIN words w ON w.response_url = q.url
+            UNION ALL SELECT q.key, 1, w.response_url FROM q JOIN words w ON w.response_word = q.word
+            UNION ALL SELECT q.key, 2, w.response_url FROM q JOIN words w ON w.input_word = q.word
+            UNION ALL SELECT q.key, 3, a.response_url FROM q JOIN aliases a ON a.input_word = q.word
+            UNION ALL SELECT q.key, 4, i.response_url FROM q JOIN inflections i ON i.form = lower(q.word)
+            UNION ALL SELECT q.key, 5, w.response_url FROM q JOIN words w ON w.response_word = substr(q.word, 1, length(q.word) - 1) WHERE q.word LIKE '%s'
+            UNION ALL SELECT q.key, 6, w.response_url FROM q JOIN words w ON w.input_word = substr(q.word, 1, length(q.word) - 1) WHERE q.word LIKE '%s'
+            UNION ALL SELECT q.key, 7, w.response_url FROM q JOIN words w ON w.response_word = substr(q.word, 1, length(q.word) - 2) WHERE q.word LIKE '%es'
+            UNION ALL SELECT q.key, 8, w.response_url FROM q JOIN words w ON w.input_word = substr(q.word, 1, length(q.word) - 2) WHERE q.word LIKE '%es'""",
+            params,
         )
     except sqlite3.OperationalError as error:
         if "no such table" in str(error):
@@ -103,7 +359,33 @@ def check_word_in_table(word, request_url):
     except sqlite3.Error:
         raise
     else:
-        return cur.fetchone()
+        best = {}
+        for key, branch, response_url in cur:
+            if key not in best or branch < best[key][0]:
+                best[key] = (branch, response_url)
+        return [best[key][1] if key in best else None for key in range(len(lookups))]
+
+
+def insert_miss_into_table(request_url, suggestions, ttl):
+    now = datetime.datetime.now()
+    try:
+        con.execute("INSERT OR REPLACE INTO misses (request_url, suggestions, created_at) VALUES (?, ?, ?)", (request_url, compress(json.dumps(suggestions)), now))
+        con.execute("DELETE FROM misses WHERE created_at < ?", (now - ttl,))
+    except sqlite3.Error:
+        con.rollback()
+        raise
+    else:
+        con.commit()
+
+
+def get_misses_from_table(request_urls, ttl):
+    placeholders = ", ".join("?" * len(request_urls))
+    cur = con.execute(
+        f"SELECT request_url, suggestions FROM misses WHERE request_url IN ({placeholders}) AND created_at >= ?",
+        (*request_urls, datetime.datetime.now() - ttl)
+    )
+    misses = {url: json.loads(decompress(suggestions)) for url, suggestions in cur.fetchall()}
+    return [misses.get(url) for url in request_urls]
 
 
 def get_entry_from_table(response_url):
@@ -118,7 +400,7 @@ def get_entry_from_table(response_url):
         # NOTE (response_url) without comma won't be treated as sequence. (response_url,) should be used here.
 
         cur = con.execute(
-            "SELECT response_word, response_text FROM words WHERE response_url = ?",
+            "SELECT response_word, response_text, response_entry, created_at FROM words WHERE response_url = ?",
             (response_url,),
         )
     except sqlite3.Error:
@@ -127,12 +409,127 @@ def get_entry_from_table(response_url):
         return cur.fetchone()
 
 
-def get_entries_from_table(is_random=False):
+def get_validators_from_table(response_url):
+    return con.execute("SELECT etag, last_modified FROM words WHERE response_url = ?", (response_url,)).fetchone()
+
+
+def touch_entry_in_table(response_url):
     try:
-        if is_random:
-            cur = con.execute("SELECT response_word, response_url FROM words ORDER BY RANDOM() LIMIT 20")
+        con.execute("UPDATE words SET last_accessed = ?, hits = hits + 1 WHERE response_url = ?", (datetime.datetime.now(), response_url))
+    except sqlite3.Error:
+        raise
+    else:
+        con.commit()
+
+
+def evict_entries_from_table(max_entries, max_bytes, policy, batch_size=50):
+    """Delete at most batch_size entries over the budget, so every insert pays only a small, indexed share of the eviction."""
+
+    count = 0
+    if max_entries:
+        entries = con.execute("SELECT value FROM stats WHERE name = 'entries'").fetchone()[0]
+        count = max(entries - max_entries, 0)
+
+    if max_bytes and count < batch_size:
+        page_size = con.execute("PRAGMA page_size").fetchone()[0]
+        page_count = con.execute("PRAGMA page_count").fetchone()[0]
+        freelist_count = con.execute("PRAGMA freelist_count").fetchone()[0]
+        if (page_count - freelist_count) * page_size > max_bytes:
+            count = batch_size
+
+    count = min(count, batch_size)
+    if count == 0:
+        return []
+
+    order = "hits, last_accessed" if policy == "lfu" else "last_accessed"
+    try:
+        urls = con.execute(
+            f"""DELETE FROM words WHERE rowid IN (
+            SELECT rowid FROM words ORDER BY {order} LIMIT ?)
+            RETURNING response_url, rowid""",
+            (count,)
+        ).fetchall()
+
+        for url, rowid in urls:
+            delete_links_from_table(url, rowid)
+    except sqlite3.Error:
+        raise
+    else:
+        con.commit()
+        # execute() would step the pragma once, freeing a single page; executescript() runs it to the end
+        con.executescript("PRAGMA incremental_vacuum")
+        return [url for url, _ in urls]
+
+
+def update_entry_in_table(response_url, entry):
+    try:
+        rowid = con.execute("UPDATE words SET response_entry = ? WHERE response_url = ? RETURNING rowid", (dump_entry(entry), response_url)).fetchone()[0]
+        insert_forms_into_table(response_url, get_word_forms(entry))
+        con.execute("DELETE FROM senses WHERE rowid = ?", (rowid,))
+        insert_senses_into_table(rowid, entry)
+    except sqlite3.Error:
+        raise
+    else:
+        con.commit()
+
+
+def refresh_entry_in_table(response_url, text, entry, validators):
+    """Store a revalidated entry, or when text is None, as the page hasn't changed, only restart its age."""
+
+    now = datetime.datetime.now()
+    etag, last_modified = validators
+    try:
+        if text is None:
+            con.execute(
+                "UPDATE words SET created_at = ?, etag = coalesce(?, etag), last_modified = coalesce(?, last_modified) WHERE response_url = ?",
+                (now, etag, last_modified, response_url)
+            )
         else:
-            cur = con.execute("SELECT response_word, response_url, created_at FROM words")
+            row = con.execute(
+                "UPDATE words SET response_word = ?, response_text = ?, response_entry = ?, created_at = ?, etag = ?, last_modified = ? WHERE response_url = ? RETURNING rowid",
+                (entry["word"], compress(text), dump_entry(entry), now, etag, last_modified, response_url)
+            ).fetchone()
+            if row is not None:
+                insert_forms_into_table(response_url, get_word_forms(entry))
+                con.execute("DELETE FROM senses WHERE rowid = ?", row)
+                insert_senses_into_table(row[0], entry)
+    except sqlite3.Error:
+        con.rollback()
+        raise
+    else:
+        con.commit()
+
+
+def get_random_entries_from_table(count=20):
+    # Sample by rowid with one indexed lookup each, instead of ORDER BY RANDOM() sorting the whole table
+    low, high = con.execute("SELECT min(rowid), max(rowid) FROM words").fetchone()
+    if low is None:
+        return []
+
+    entries = {}
+    attempts = 0
+    while len(entries) < count and attempts < count * 5:
+        attempts += 1
+        row = con.execute(
+            "SELECT rowid, response_word, response_url FROM words WHERE rowid >= ? ORDER BY rowid LIMIT 1",
+            (random.randint(low, high),)
+        ).fetchone()
+        if row is not None:
+            entries[row[0]] = row[1 : ]
+    return list(entries.values())
+
+
+def get_entries_from_table(method, newest_first=False):
+    try:
+        if method == "random":
+            return iter(get_random_entries_from_table())
+
+        # Ordered by the indexes, and created_at isn't selected, so no datetime is built for every row
+        if method == "by_time":
+            order = "created_at DESC" if newest_first else "created_at"
+        else:
+            order = "response_word"
+        cur = con.execute(f"SELECT response_word, response_url FROM words ORDER BY {order}")
     except sqlite3.OperationalError as error:
         if "no such table" in str(error):
             create_table()
@@ -140,13 +537,68 @@ def get_entries_from_table(is_random=False):
             raise
     except sqlite3.Error:
         raise
+    else:
+        return cur
+
+
+def stream_rows(cur, batch_size=500):
+    """Yield the rows of a cursor opened on the DB thread, fetching them there batch by batch."""
+
+    while True:
+        rows = executor.submit(cur.fetchmany, batch_size).result()
+        if not rows:
+            break
+        yield from rows
+
+
+def search_senses_in_table(query, limit=100):
+    # Quote every term, so that user input like "don't" or "co-op" can't be taken as FTS5 query syntax
+    terms = " ".join('"' + term.replace('"', '""') + '"' for term in query.split())
+
+    try:
+        cur = con.execute(
+            """SELECT words.response_word, words.response_url FROM senses
+            JOIN words ON words.rowid = senses.rowid
+            WHERE senses MATCH ?
+            ORDER BY senses.rank
+            LIMIT ?""",
+            (terms, limit),
+        )
+    except sqlite3.Error:
+        raise
     else:
         return cur.fetchall()
 
 
+def compress_entries_in_table(batch_size=500):
+    rowids = [row[0] for row in con.execute(
+        "SELECT rowid FROM words WHERE typeof(response_text) = 'text' OR typeof(response_entry) = 'text'"
+    )]
+
+    for i in range(0, len(rowids), batch_size):
+        for rowid in rowids[i : i + batch_size]:
+            text, entry = con.execute("SELECT response_text, response_entry FROM words WHERE rowid = ?", (rowid,)).fetchone()
+            entry = compress(entry) if isinstance(entry, str) else entry
+            con.execute("UPDATE words SET response_text = ?, response_entry = ? WHERE rowid = ?", (compress(decompress(text)), entry, rowid))
+        con.commit()
+
+    # Give the pages freed by the smaller rows back to the file system
+    con.execute("VACUUM")
+    return len(rowids)
+
+
 def delete_entry_from_table(word):
     try:
-        res_url = con.execute("DELETE FROM words WHERE response_word = ? OR input_word = ? RETURNING response_url", (word, word)).fetchone()
+        res_url = con.execute(
+            """DELETE FROM words WHERE rowid IN (
+            SELECT rowid FROM words WHERE response_word = ?
+            UNION SELECT rowid FROM words WHERE input_word = ?)
+            RETURNING response_url, rowid""",
+            (word, word)
+        ).fetchall()
+
+        for url, rowid in res_url:
+            delete_links_from_table(url, rowid)
     except sqlite3.OperationalError as error:
         if "no such table" in str(error):
             create_table()
@@ -156,12 +608,12 @@ def delete_entry_from_table(word):
         raise
     else:
         con.commit()
-        return res_url
+        return res_url[0] if res_url else None
 
 
 async def delete_from_cache(word):
     try:
-        result = delete_entry_from_table(word)
+        result = await run_in_db(delete_entry_from_table, word)
     except sqlite3.Error as error:
         logger.error(f'{OP.CANCELLED.name} deleting "{word}" from cache: [{error.__class__.__name__}] {error}\n')
         sys.exit(4)
@@ -173,65 +625,199 @@ async def delete_from_cache(word):
             print(f'{OP.DELETED.name} "{word}" from {dict_name} in cache successfully')
 
 
-def list_cache(method):
-    is_random = True if method == "random" else False
+async def compress_cache():
+    size = os.path.getsize(DB)
+    try:
+        count = await run_in_db(compress_entries_in_table)
+    except sqlite3.Error as error:
+        logger.error(f'{OP.CANCELLED.name} compressing cache: [{error.__class__.__name__}] {error}\n')
+        sys.exit(4)
+    else:
+        new_size = os.path.getsize(DB)
+        print(f"{OP.UPDATED.name} {count} entries in cache: {size / 1024 / 1024:.1f}MB -> {new_size / 1024 / 1024:.1f}MB")
+
 
+async def list_cache(method):
+    # fzf shows its first line at the bottom, next to the prompt, so the latest words go first there
+    has_fzf = has_tool("fzf")
     try:
-        data = get_entries_from_table(is_random)
+        cur = await run_in_db(get_entries_from_table, method, has_fzf)
     except sqlite3.Error as error:
         logger.error(f'{OP.CANCELLED.name} listing cache: [{error.__class__.__name__}] {error}\n')
         sys.exit(4)
     else:
-        if data is None:
+        data = cur if method == "random" else stream_rows(cur)
+        first = next(data, None)
+        if first is None:
             print("You may haven't searched any word yet")
             sys.exit(3)
 
-        has_fzf = has_tool("fzf")
-        if method == "by_alpha":
-            data.sort()
-        elif method == "by_time":
-            reverse = True if has_fzf else False
-            data.sort(reverse=reverse, key=lambda tup: tup[2])
+        return (has_fzf, itertools.chain([first], data))
 
-        return (has_fzf, data)
 
+async def search_cache(query):
+    """Search the definitions and examples of every cached page, best matches first."""
 
-async def check_cache(input_word, req_url):
-    logger.debug(f'{OP.SEARCHING.name} "{input_word}" in cache')
+    logger.debug(f'{OP.SEARCHING.name} "{query}" in cached definitions and examples')
 
     try:
-        data = check_word_in_table(input_word, req_url)
+        data = await run_in_db(search_senses_in_table, query)
     except sqlite3.Error as error:
-        logger.error(f'{OP.CANCELLED.name} searching "{input_word}" in cache: [{error.__class__.__name__}] {error}\n')
+        logger.error(f'{OP.CANCELLED.name} searching "{query}" in cache: [{error.__class__.__name__}] {error}\n')
         sys.exit(4)
     else:
-        # considering user might input plural nouns, or verbs with tenses
-        if data is None:
-            if "s" != input_word[-1]:
-                return None
-            else:
-                data = check_word_in_table(input_word[:-1], req_url)
-                if data is None:
-                    if "es" != input_word[-2:]:
-                        return None
-                    else:
-                        data = check_word_in_table(input_word[:-2], req_url)
-                        if data is None:
-                            return None
-        return data[0]
+        if not data:
+            print(f'{OP.NOT_FOUND.name} "{query}" in cached definitions and examples')
+            sys.exit(3)
+
+        return (has_tool("fzf"), data)
+
+
+async def probe_cache(lookups):
+    """Look up many (input_word, req_url) in one round trip, e.g. all the words of a multi-word search."""
+
+    words = ", ".join(f'"{word}"' for word, _ in lookups)
+    logger.debug(f'{OP.SEARCHING.name} {words} in cache')
+
+    try:
+        # Stay well under sqlite's limit on the number of bound parameters
+        results = []
+        for i in range(0, len(lookups), 500):
+            results.extend(await run_in_db(probe_words_in_table, lookups[i : i + 500]))
+        return results
+    except sqlite3.Error as error:
+        logger.error(f'{OP.CANCELLED.name} searching {words} in cache: [{error.__class__.__name__}] {error}\n')
+        sys.exit(4)
+
+
+async def check_cache(input_word, req_url):
+    return (await probe_cache([(input_word, req_url)]))[0]
+
+
+async def probe_misses(request_urls):
+    """Return the cached suggestions for each request url not found lately, None for the rest, including None urls."""
+
+    urls = [url for url in request_urls if url is not None]
+    if not CACHE_MISS_TTL_HOURS or not urls:
+        return [None] * len(request_urls)
+
+    ttl = datetime.timedelta(hours=CACHE_MISS_TTL_HOURS)
+    try:
+        results = []
+        for i in range(0, len(urls), 500):
+            results.extend(await run_in_db(get_misses_from_table, urls[i : i + 500], ttl))
+        misses = dict(zip(urls, results))
+        return [misses.get(url) if url is not None else None for url in request_urls]
+    except sqlite3.Error as error:
+        logger.error(f'{OP.CANCELLED.name} searching misses in cache: [{error.__class__.__name__}] {error}\n')
+        return [None] * len(request_urls)
+
+
+async def check_misses(request_url):
+    return (await probe_misses([request_url]))[0]
+
+
+async def save_miss_to_cache(request_url, suggestions):
+    if not CACHE_MISS_TTL_HOURS:
+        return
+
+    try:
+        await run_in_db(insert_miss_into_table, request_url, suggestions, datetime.timedelta(hours=CACHE_MISS_TTL_HOURS))
+    except sqlite3.Error as error:
+        logger.error(f'{OP.CANCELLED.name} caching the miss of {request_url}: [{error.__class__.__name__}] {error}\n')
+    else:
+        logger.debug(f'{OP.CACHED.name} the miss of {request_url} with {len(suggestions)} suggestions')
 
 
 async def get_cache(response_url):
-    result = get_entry_from_table(response_url)
+    result = await run_in_db(get_entry_from_table, response_url)
     if result is None:
         logger.error(f'The function argument "{response_url}" must actually come from the cache.')
         sys.exit(4)
-    return result
+
+    try:
+        await run_in_db(touch_entry_in_table, response_url)
+    except sqlite3.Error as error:
+        logger.debug(f'{OP.CANCELLED.name} tracking the access of {response_url}: [{error.__class__.__name__}] {error}')
+
+    res_word, res_text, res_entry, created_at = result
+    return res_word, decompress(res_text), load_entry(res_entry), created_at
+
+
+def is_stale(created_at):
+    return CACHE_STALE_HOURS > 0 and created_at is not None and datetime.datetime.now() - created_at > datetime.timedelta(hours=CACHE_STALE_HOURS)
+
+
+async def get_cache_validators(response_url):
+    """Return the (etag, last_modified) stored with a cached page, None for each one missing."""
+    try:
+        row = await run_in_db(get_validators_from_table, response_url)
+    except sqlite3.Error as error:
+        logger.debug(f'{OP.CANCELLED.name} reading the validators of {response_url}: [{error.__class__.__name__}] {error}')
+        row = None
+    return row if row is not None else (None, None)
 
 
-async def save_to_cache(input_word, response_word, response_url, response_text):
+async def refresh_cache(response_url, text=None, entry=None, validators=(None, None)):
     try:
-        result = insert_entry_into_table(input_word, response_word, response_url, response_text)
+        await run_in_db(refresh_entry_in_table, response_url, text, entry, validators)
+    except sqlite3.Error as error:
+        logger.error(f'{OP.CANCELLED.name} revalidating {response_url} in cache: [{error.__class__.__name__}] {error}\n')
+    else:
+        logger.debug(f'{OP.UPDATED.name} {response_url} in cache' + ("" if text is not None else ", unchanged"))
+
+
+async def evict_from_cache():
+    if not CACHE_MAX_ENTRIES and not CACHE_MAX_MB:
+        return
+
+    try:
+        urls = await run_in_db(evict_entries_from_table, CACHE_MAX_ENTRIES, int(CACHE_MAX_MB * 1024 * 1024), CACHE_EVICTION)
+    except sqlite3.Error as error:
+        logger.error(f'{OP.CANCELLED.name} evicting cache: [{error.__class__.__name__}] {error}\n')
+    else:
+        for url in urls:
+            logger.debug(f'{OP.DELETED.name} {url} from cache, over the budget')
+
+
+async def save_entry_to_cache(response_url, entry):
+    """Store the parsed entry model for a row cached before the model existed, so the indexes built from it find the row."""
+    try:
+        await run_in_db(update_entry_in_table, response_url, entry)
+    except sqlite3.Error as error:
+        logger.error(f'{OP.CANCELLED.name} caching the parsed entry of {response_url}: [{error.__class__.__name__}] {error}\n')
+    else:
+        logger.debug(f'{OP.UPDATED.name} the parsed entry of {response_url}')
+
+
+def schedule_flush():
+    global flush_timer
+    if flush_timer is None:
+        flush_timer = asyncio.get_running_loop().call_later(CACHE_FLUSH_SECONDS, start_flush)
+
+
+def start_flush():
+    task = asyncio.create_task(flush_cache())
+    flush_tasks.add(task)
+    task.add_done_callback(flush_tasks.discard)
+
+
+async def flush_cache():
+    """Write the pending entries in one transaction. Called on the batch size or time threshold, and at exit by main.main()."""
+
+    global flush_timer
+    if flush_timer is not None:
+        flush_timer.cancel()
+        flush_timer = None
+
+    if not pending_entries:
+        return
+
+    entries = pending_entries[:]
+    pending_entries.clear()
+
+    try:
+        results = await run_in_db(insert_entries_into_table, entries)
 
         # a duplicate check way other than ON CONFLICT
         # sqllite3.IntegrityError: NOT NULL constraint failed
@@ -243,11 +829,25 @@ async def save_to_cache(input_word, response_word, response_url, response_text):
         """
 
     except sqlite3.Error as error:
-        logger.error(f'{OP.CANCELLED.name} caching "{input_word}": [{error.__class__.__name__}] {error}\n')
-        sys.exit(4)
+        words = ", ".join(f'"{entry[0]}"' for entry in entries)
+        logger.error(f'{OP.CANCELLED.name} caching {words}: [{error.__class__.__name__}] {error}\n')
 
     else:
-        if result is None:
-            logger.debug(f'{OP.CANCELLED.name} caching, already cached before') # hit ON CONFLICT
-        else:
-            logger.debug(f'{OP.CACHED.name} "{result[0]}"')
+        for entry, result in zip(entries, results):
+            if result is None:
+                logger.debug(f'{OP.CANCELLED.name} caching "{entry[0]}", already cached before') # hit ON CONFLICT
+            else:
+                logger.debug(f'{OP.CACHED.name} "{result[0]}"')
+        await evict_from_cache()
+
+
+async def save_to_cache(input_word, response_word, response_url, response_text, response_entry, validators=(None, None)):
+    # Write-behind: concurrent lookups of a multi-word search share one transaction instead of committing one by one
+    pending_entries.append((input_word, response_word, response_url, response_text, response_entry, validators))
+    if len(pending_entries) >= CACHE_BATCH_SIZE:
+        await flush_cache()
+    else:
+        schedule_flush()
+
+
+executor.submit(migrate).result()
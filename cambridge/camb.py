@@ -1,12 +1,14 @@
 import sys
 import re
-from bs4 import BeautifulSoup # type: ignore
 import asyncio
+from bs4 import BeautifulSoup # type: ignore
+from lxml import etree # type: ignore
 
-from .console import c_print
+from .console import c_print, print_lock
 from .log import logger
-from .utils import fetch, get_request_url, parse_response_url, replace_all, OP, DICT, has_tool, get_suggestion, get_suggestion_by_fzf, cancel_on_error, quit_on_no_result, cancel_on_error_without_retry, remove_extra_spaces
-from .cache import check_cache, save_to_cache, get_cache
+from .config import HEDGE_DELAY_SECONDS, SUGGESTION_PREFETCH
+from .utils import fetch, get_request_url, parse_response_url, replace_all, OP, DICT, has_tool, get_suggestion, get_suggestion_by_fzf, quit_on_no_result, remove_extra_spaces, run_in_background, get_validators, get_dict_name_by_url, read_html_until, HtmlStream, is_failing, FetchError, cancel_tasks, run_in_thread
+from .cache import check_cache, check_misses, save_to_cache, save_miss_to_cache, get_cache, save_entry_to_cache, is_stale, refresh_cache, get_cache_validators
 from . import webster
 
 
@@ -17,121 +19,333 @@ CAMBRIDGE_CN_SEARCH_URL = CAMBRIDGE_URL + "/search/direct/?datasetsearch=english
 CAMBRIDGE_SPELLCHECK_URL = CAMBRIDGE_URL + "/spellcheck/english/?q="
 CAMBRIDGE_SPELLCHECK_URL_CN = CAMBRIDGE_URL + "/spellcheck/english-chinese-simplified/?q="
 
+ENTRY_CLASSES = ["pr entry-body__el", "entry-body__el clrd js-share-holder", "pr idiom-block"]
+
+
+def get_search_url(input_word, is_ch=False):
+    url = CAMBRIDGE_CN_SEARCH_URL if is_ch else CAMBRIDGE_EN_SEARCH_URL
+    return get_request_url(url, input_word, DICT.CAMBRIDGE.name)
+
 
 async def search_cambridge(session, input_word, is_fresh=False, is_ch=False, no_suggestions=False, req_url=None):
     if req_url is None:
-        url = CAMBRIDGE_CN_SEARCH_URL if is_ch else CAMBRIDGE_EN_SEARCH_URL
-        req_url = get_request_url(url, input_word, DICT.CAMBRIDGE.name)
+        req_url = get_search_url(input_word, is_ch)
 
     if is_fresh:
-        await fresh_run(session, input_word, is_ch, no_suggestions, req_url)
+        await fresh_run(session, input_word, is_ch, no_suggestions, req_url, await check_cache(input_word, req_url))
     else:
         res_url = await check_cache(input_word, req_url)
         if res_url is None:
             logger.debug(f'{OP.NOT_FOUND.name} "{input_word}" in cache')
-            await fresh_run(session, input_word, is_ch, no_suggestions, req_url)
+            suggestions = await check_misses(req_url)
+            if suggestions is None:
+                await fresh_run(session, input_word, is_ch, no_suggestions, req_url)
+            else:
+                logger.debug(f'{OP.FOUND.name} the suggestions for "{input_word}" in cache')
+                await suggestion_run(session, input_word, no_suggestions, suggestions)
         elif DICT.CAMBRIDGE.name.lower() not in res_url:
             await webster.cache_run(res_url)
         else:
             await cache_run(res_url)
 
 
-async def cache_run(res_url_from_cache):
-    res_word, res_text = await get_cache(res_url_from_cache)
+async def suggestion_run(session, input_word, no_suggestions, suggestions):
+    if no_suggestions:
+        sys.exit(-1)
+
+    if not suggestions:
+        quit_on_no_result(DICT.CAMBRIDGE.name, is_spellcheck=True)
+
+    # The network would sit idle while the user is choosing, so fetch the top suggestions meanwhile
+    prefetches = {i: asyncio.create_task(prefetch(session, i)) for i in suggestions[ : SUGGESTION_PREFETCH]}
+    try:
+        # One prompt at a time, and no other word printed under it, while the prefetches go on
+        async with print_lock:
+            logger.debug(f'{OP.PRINTING.name} out suggestions for "{input_word}"')
+            select_word = await run_in_thread(get_suggestion_by_fzf if has_tool("fzf") else get_suggestion, suggestions, DICT.CAMBRIDGE.name)
+        chosen = prefetches.pop(select_word, None)
+    finally:
+        cancel_tasks(prefetches.values())
+
+    if select_word == "":
+        logger.debug(f'{OP.SWITCHED.name} to {DICT.MERRIAM_WEBSTER.name}')
+        await webster.search_webster(session, input_word, True, no_suggestions, None) # type: ignore
+    else:
+        logger.debug(f'{OP.SELECTED.name} "{select_word}"')
+        entry = await get_prefetched(chosen)
+        if entry is None:
+            await search_cambridge(session, select_word, False, False, no_suggestions, None)
+        else:
+            logger.debug(f'{OP.FOUND.name} "{select_word}" prefetched')
+            async with print_lock:
+                await print_and_cache(select_word, entry)
+
+
+async def prefetch(session, input_word):
+    """Fetch a suggestion that isn't cached yet, returning it as fetch_entry() does."""
+
+    req_url = get_search_url(input_word)
+    if await check_cache(input_word, req_url) is not None:
+        return None
+    return await fetch_entry(session, req_url)
+
+
+async def get_prefetched(task):
+    if task is None:
+        return None
+    try:
+        return await task
+    except FetchError as error:
+        logger.debug(f'{OP.CANCELLED.name} prefetching: {error}')
+        return None
+
+
+async def cache_run(res_url_from_cache, session=None):
+    """Print a cached entry; given the session, also revalidate it in the background if it is stale."""
+
+    res_word, res_text, res_entry, created_at = await get_cache(res_url_from_cache)
     logger.debug(f'{OP.FOUND.name} "{res_word}" from {DICT.CAMBRIDGE.name} in cache')
-    logger.debug(f"{OP.PARSING.name} {res_url_from_cache}")
 
+    if session is not None and is_stale(created_at):
+        logger.debug(f'{OP.REVALIDATING.name} {res_url_from_cache} cached at {created_at}')
+        run_in_background(revalidate(session, res_url_from_cache, res_word, res_text))
+
+    # Printed from the cleaned html, by the same printer as a fresh lookup, so a hit looks exactly like the page did
+    soup = BeautifulSoup(res_text, "lxml")
+    first_dict = soup.find("div", "pr dictionary") or soup.find("div", "pr di superentry")
+    async with print_lock:
+        await parse_and_print(first_dict, res_url_from_cache, new_line=False)
+        c_print(f'\n#[#757575]{OP.FOUND.name} "{res_word}" from {DICT.CAMBRIDGE.name} in cache. You can add "-f -w" to fetch the {DICT.MERRIAM_WEBSTER.name} dictionary')
+
+    # Cached before the entry models, which the inflection and definition indexes are built from
+    if res_entry is None:
+        await save_entry_to_cache(res_url_from_cache, extract_entry(first_dict, res_word))
+
+
+async def fresh_run(session, input_word, is_ch, no_suggestions, req_url, cached_url=None):
+    """Look up the word afresh; if Cambridge keeps failing, look it up in Merriam-Webster instead."""
+
+    try:
+        await fresh_lookup(session, input_word, is_ch, no_suggestions, req_url, cached_url)
+    except FetchError as error:
+        print(error)
+        if is_failing(CAMBRIDGE_URL) and not is_failing(webster.WEBSTER_BASE_URL):
+            c_print(f'#[#757575]{OP.SWITCHED.name} to {DICT.MERRIAM_WEBSTER.name} for "{input_word}"')
+            await webster.search_webster(session, input_word, False, no_suggestions, None)
+
+
+async def hedged_run(session, input_word, no_suggestions, req_url):
+    """Look up the word in Cambridge, and in Merriam-Webster too if Cambridge hasn't answered within HEDGE_DELAY_SECONDS; print whichever entry comes first, and cache both."""
+
+    lookups = {asyncio.create_task(fetch_entry(session, req_url)): DICT.CAMBRIDGE.name}
+    done, _ = await asyncio.wait(lookups, timeout=HEDGE_DELAY_SECONDS)
+    if not done:
+        logger.debug(f'{OP.SEARCHING.name} "{input_word}" in {DICT.MERRIAM_WEBSTER.name} as well, {DICT.CAMBRIDGE.name} has not answered in {HEDGE_DELAY_SECONDS}s')
+        lookups[asyncio.create_task(webster.fetch_entry(session, webster.get_search_url(input_word)))] = DICT.MERRIAM_WEBSTER.name
+
+    pending = set(lookups)
+    while pending:
+        done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+        found = [(task, task.result()) for task in done if task.exception() is None and task.result() is not None]
+        if len(found) == 0:
+            continue
+
+        # The first entry is printed, the slower one is only cached when it comes
+        task, entry = found[0]
+        dict_name = lookups[task]
+        for other, other_entry in found[1 : ]:
+            run_in_background(cache_hedged(lookups[other], input_word, other_entry))
+        for other in pending:
+            run_in_background(cache_hedged(lookups[other], input_word, other))
+
+        logger.debug(f'{OP.FOUND.name} "{input_word}" in {dict_name} first')
+        async with print_lock:
+            if dict_name == DICT.CAMBRIDGE.name:
+                await print_and_cache(input_word, entry)
+            else:
+                c_print(f'#[#757575]{OP.SWITCHED.name} to {DICT.MERRIAM_WEBSTER.name} for "{input_word}", {DICT.CAMBRIDGE.name} was slower')
+                await webster.print_and_cache(input_word, entry)
+        return
+
+    # Neither has an entry for it, or both failed, so go the usual way with its suggestions and errors
+    await search_cambridge(session, input_word, False, False, no_suggestions, req_url)
+
+
+async def cache_hedged(dict_name, input_word, entry):
+    if isinstance(entry, asyncio.Task):
+        try:
+            entry = await entry
+        except FetchError as error:
+            logger.debug(f'{OP.CANCELLED.name} caching "{input_word}" from {dict_name}: {error}')
+            return
+        if entry is None:
+            return
+
+    if dict_name == DICT.CAMBRIDGE.name:
+        await print_and_cache(input_word, entry, echo=False)
+    else:
+        await webster.print_and_cache(input_word, entry, echo=False)
+
+
+async def fetch_entry(session, req_url):
+    """Fetch the page of a word without printing it, returning (res_url, soup, first_dict, validators), or None if the word isn't found."""
+
+    response = await fetch(session, req_url)
+    res_url = str(response.real_url)
+    if "spellcheck" in res_url:
+        # Keep the suggestions, so falling back to the usual lookup needs no request
+        suggestions = await read_suggestions(response)
+        if suggestions is not None:
+            await save_miss_to_cache(req_url, suggestions)
+        return None
+
+    _, res_text = await read_html_until(response, is_first_dict)
     soup = BeautifulSoup(res_text, "lxml")
     first_dict = soup.find("div", "pr dictionary") or soup.find("div", "pr di superentry")
-    await parse_and_print(first_dict, res_url_from_cache, new_line=False)
-    c_print(f'\n#[#757575]{OP.FOUND.name} "{res_word}" from {DICT.CAMBRIDGE.name} in cache. You can add "-f -w" to fetch the {DICT.MERRIAM_WEBSTER.name} dictionary')
+    if first_dict is None:
+        return None
+    return parse_response_url(res_url), soup, first_dict, get_validators(response)
+
 
+async def print_and_cache(input_word, entry, echo=True):
+    """Print a page fetched by fetch_entry, unless echo is False, and cache it."""
 
-async def fresh_run(session, input_word, is_ch, no_suggestions, req_url):
-        response = await fetch(session, req_url)
+    res_url, soup, first_dict, validators = entry
+    if echo:
+        await parse_and_print(first_dict, res_url)
+    await cache(soup, first_dict, input_word, res_url, validators)
+
+
+def is_first_dict(element):
+    # Only the first dictionary of a page is printed, so its download can stop there
+    return element.tag == "div" and element.get("class") == "pr dictionary"
+
+
+def get_class(element):
+    return " ".join(element.get("class", "").split())
+
+
+def is_entry(element):
+    # An entry of the first dictionary, printed as soon as it has been downloaded; nested entries are printed with the outermost one
+    if element.tag != "div" or get_class(element) not in ENTRY_CLASSES:
+        return False
+
+    for ancestor in element.iterancestors():
+        if ancestor.tag == "div" and get_class(ancestor) in ENTRY_CLASSES:
+            return False
+        if is_first_dict(ancestor):
+            return True
+    return False
+
+
+async def fresh_lookup(session, input_word, is_ch, no_suggestions, req_url, cached_url=None):
+        """Fetch and print the word; if it is cached at cached_url already, an unchanged page is printed from the cache."""
+
+        validators = (None, None)
+        if cached_url is not None and get_dict_name_by_url(cached_url) == DICT.CAMBRIDGE.name:
+            validators = await get_cache_validators(cached_url)
+
+        response = await fetch(session, req_url, validators)
         res_url = str(response.real_url)
 
+        if response.status == 304:
+            if parse_response_url(res_url) == cached_url:
+                logger.debug(f'{OP.FOUND.name} {cached_url} not modified')
+                await refresh_cache(cached_url, validators=get_validators(response))
+                await cache_run(cached_url)
+                return
+
+            # Validated against another page of the cache, e.g. the other dataset
+            response = await fetch(session, req_url)
+            res_url = str(response.real_url)
+
         if "spellcheck" in res_url:
             logger.debug(f'{OP.NOT_FOUND.name} "{input_word}" at {req_url}')
 
-            if no_suggestions:
-                sys.exit(-1)
-
-            spell_base_url = CAMBRIDGE_SPELLCHECK_URL_CN if is_ch else CAMBRIDGE_SPELLCHECK_URL
-            spell_req_url = get_request_url(spell_base_url, input_word, DICT.CAMBRIDGE.name)
-
-            spell_res = await fetch(session, spell_req_url)
-            spell_res_text = None
-            attempt = 0
-            while True:
-                try:
-                    spell_res_text = await spell_res.text()
-                except asyncio.TimeoutError as error:
-                    attempt = cancel_on_error(spell_req_url, error, attempt, OP.FETCHING.name)
-                    continue
-                except Exception as error:
-                    cancel_on_error_without_retry(spell_req_url, error, OP.FETCHING.name)
-                    break
-                else:
-                    break
+            # The search has been redirected to the spellcheck page already, so its suggestions need no second request
+            logger.debug(f"{OP.PARSING.name} out suggestions at {res_url}")
+            suggestions = await read_suggestions(response)
 
-            if spell_res_text is not None:
+            if suggestions is None:
+                spell_base_url = CAMBRIDGE_SPELLCHECK_URL_CN if is_ch else CAMBRIDGE_SPELLCHECK_URL
+                spell_req_url = get_request_url(spell_base_url, input_word, DICT.CAMBRIDGE.name)
+
+                spell_res = await fetch(session, spell_req_url)
                 logger.debug(f"{OP.PARSING.name} out suggestions at {spell_res.url}")
-                soup = BeautifulSoup(spell_res_text, "lxml")
-                node = soup.find("div", "hfl-s lt2b lmt-10 lmb-25 lp-s_r-20")
-                suggestions = []
-
-                if not node:
-                    quit_on_no_result(DICT.CAMBRIDGE.name, is_spellcheck=True)
-
-                for ul in node.find_all("ul", "hul-u"): # type: ignore
-                    if "We have these words with similar spellings or pronunciations:" in ul.find_previous_sibling().text:
-                        for i in ul.find_all("li"):
-                            sug = replace_all(i.text)
-                            suggestions.append(sug)
-
-                logger.debug(f"{OP.PRINTING.name} out suggestions at {spell_res.url}")
-                select_word = get_suggestion_by_fzf(suggestions, DICT.CAMBRIDGE.name) if has_tool("fzf") else get_suggestion(suggestions, DICT.CAMBRIDGE.name)
-                if select_word == "":
-                    logger.debug(f'{OP.SWITCHED.name} to {DICT.MERRIAM_WEBSTER.name}')
-                    await webster.search_webster(session, input_word, True, no_suggestions, None) # type: ignore
-                else:
-                    logger.debug(f'{OP.SELECTED.name} "{select_word}"')
-                    await search_cambridge(session, select_word, False, False, no_suggestions, None)
+                suggestions = await read_suggestions(spell_res) or []
+
+            # Cached even with no_suggestions, which suggestion_run() then quits on, so e.g. "camb warm" doesn't fetch the word again
+            await save_miss_to_cache(req_url, suggestions)
+            await suggestion_run(session, input_word, no_suggestions, suggestions)
 
         else:
             res_url = parse_response_url(res_url)
-            res_text = None
-            attempt = 0
-            while True:
-                try:
-                    res_text = await response.text()
-                except asyncio.TimeoutError as error:
-                    attempt = cancel_on_error(req_url, error, attempt, OP.FETCHING.name)
-                    continue
-                # There is also a scenario that in the process of cancelling, while is still looping, leading to run coroutine with a closed session.
-                # If session is closed, and you go on connecting, ClientConnectionError will be throwed.
-                except Exception as error:
-                    cancel_on_error_without_retry(req_url, error, OP.FETCHING.name)
-                    break
-                else:
-                    break
+            stream = HtmlStream(response, is_first_dict, is_entry)
+            is_printed = await stream_and_print(stream, res_url)
+
+            soup = BeautifulSoup(stream.text, "lxml")
+            first_dict = soup.find("div", "pr dictionary") or soup.find("div", "pr di superentry")
+            if first_dict is None:
+                quit_on_no_result(DICT.CAMBRIDGE.name, is_spellcheck=False)
+
+            logger.debug(f'{OP.FOUND.name} "{input_word}" in {DICT.CAMBRIDGE.name} at {res_url}')
+            if not is_printed:
+                async with print_lock:
+                    await parse_and_print(first_dict, res_url, new_line=True)
+            await cache(soup, first_dict, input_word, res_url, get_validators(response), res_url == cached_url)
+
+
+def is_suggestions(element):
+    return element.tag == "div" and element.get("class") == "hfl-s lt2b lmt-10 lmb-25 lp-s_r-20"
+
+
+async def read_suggestions(response):
+    """Read the spelling suggestions of a spellcheck page, stopping once they have been downloaded; None if the page doesn't list them."""
+
+    tree, _ = await read_html_until(response, is_suggestions)
+    nodes = tree.xpath('//div[@class="hfl-s lt2b lmt-10 lmb-25 lp-s_r-20"]') if tree is not None else []
+    if len(nodes) == 0:
+        return None
+
+    suggestions = []
+    for ul in nodes[0].xpath('.//ul[contains(concat(" ", normalize-space(@class), " "), " hul-u ")]'):
+        title = ul.getprevious()
+        if title is not None and "We have these words with similar spellings or pronunciations:" in "".join(title.itertext()):
+            for i in ul.iter("li"):
+                suggestions.append(replace_all("".join(i.itertext())))
+    return suggestions
+
+
+async def revalidate(session, res_url, res_word, res_text):
+    try:
+        response = await fetch(session, res_url, await get_cache_validators(res_url))
+        if response.status == 304:
+            await refresh_cache(res_url, validators=get_validators(response))
+            return
+        _, text = await read_html_until(response, is_first_dict)
+    except FetchError as error:
+        logger.debug(f'{OP.CANCELLED.name} revalidating {res_url}: {error}')
+        return
 
-            if res_text is not None:
-                soup = BeautifulSoup(res_text, "lxml")
-                first_dict = soup.find("div", "pr dictionary") or soup.find("div", "pr di superentry")
-                if first_dict is None:
-                    quit_on_no_result(DICT.CAMBRIDGE.name, is_spellcheck=False)
+    first_dict = None
+    if response.status == 200:
+        soup = BeautifulSoup(text, "lxml")
+        first_dict = soup.find("div", "pr dictionary") or soup.find("div", "pr di superentry")
+    if first_dict is None:
+        logger.debug(f'{OP.CANCELLED.name} revalidating {res_url}: no entry found with STATUS {response.status}')
+        return
 
-                logger.debug(f'{OP.FOUND.name} "{input_word}" in {DICT.CAMBRIDGE.name} at {res_url}')
-                async with asyncio.TaskGroup() as tg:
-                    task1 = tg.create_task(parse_and_print(first_dict, res_url, new_line=True))
-                    task2 = tg.create_task(cache(soup, first_dict, input_word, res_url))
+    clean_text = remove_extra_spaces(str(first_dict))
+    if clean_text == res_text:
+        await refresh_cache(res_url, validators=get_validators(response))
+    else:
+        res_word = get_response_word(soup, res_word)
+        await refresh_cache(res_url, clean_text, extract_entry(first_dict, res_word), get_validators(response))
 
 
 async def parse_and_print(first_dict, res_url, new_line=True):
     logger.debug(f"{OP.PARSING.name} {res_url}")
-    nodes = first_dict.find_all("div", ["pr entry-body__el", "entry-body__el clrd js-share-holder", "pr idiom-block"]) # type: ignore
+    nodes = first_dict.find_all("div", ENTRY_CLASSES) # type: ignore
 
     logger.debug(f"{OP.PRINTING.name} the parsed result of {res_url}")
     for node in nodes:
@@ -142,14 +356,99 @@ async def parse_and_print(first_dict, res_url, new_line=True):
         print()
 
 
-async def cache(soup, first_dict, input_word, res_url):
-    res_word = input_word
+async def stream_and_print(stream, res_url):
+    """Print each entry of the first dictionary as soon as it has been downloaded, and return whether there was any entry to stream."""
+
+    is_printing = False
+    try:
+        async for element in stream:
+            if not is_printing:
+                # Hold the terminal from the first entry on, so other words looked up at the same time don't print in between
+                await print_lock.acquire()
+                is_printing = True
+                logger.debug(f"{OP.PRINTING.name} the parsed result of {res_url} as it arrives")
+
+            node = BeautifulSoup(etree.tostring(element, encoding="unicode", with_tail=False), "lxml").div
+            for i in [node, *node.find_all("div", ENTRY_CLASSES)]: # type: ignore
+                parse_dict_head(i)
+                parse_dict_body(i)
+
+        if is_printing:
+            print()
+    finally:
+        if is_printing:
+            print_lock.release()
+
+    return is_printing
+
+
+def get_response_word(soup, input_word):
     result = soup.find("b", "tb ttn").text # type: ignore
-    if len(result) != 0:
-        res_word = result
+    return result if len(result) != 0 else input_word
+
 
+async def cache(soup, first_dict, input_word, res_url, validators=(None, None), is_cached=False):
+    res_word = get_response_word(soup, input_word)
     clean_text = remove_extra_spaces(str(first_dict))
-    await save_to_cache(input_word, res_word, res_url, clean_text)
+    entry = extract_entry(first_dict, res_word)
+    if is_cached:
+        await refresh_cache(res_url, clean_text, entry, validators)
+    else:
+        await save_to_cache(input_word, res_word, res_url, clean_text, entry, validators)
+
+
+def get_item_texts(block):
+    return [remove_extra_spaces(i.text) for i in block.find_all("div", ["item lc lc1 lpb-10 lpr-10", "item lc lc1 lc-xs6-12 lpb-10 lpr-10"])]
+
+
+def extract_senses(block):
+    senses = []
+    def_blocks = block.find_all("div", "def-block ddef_block") or [block]
+    for def_block in def_blocks:
+        meaning_b = def_block.find("div", "def ddef_d db")
+        if meaning_b is None:
+            continue
+
+        examples = [replace_all(eg.text) for eg in def_block.find_all("span", "eg deg")]
+        senses.append({"definition": replace_all(meaning_b.text).rstrip(":").strip(), "examples": examples})
+    return senses
+
+
+def extract_entry(first_dict, res_word):
+    """Extract the parsed entry model of the first dictionary, which the inflection and definition indexes of the cache are built from."""
+
+    entry = {"word": res_word, "entries": [], "synonyms": [], "idioms": [], "phrasal_verbs": []}
+
+    for node in first_dict.find_all("div", ENTRY_CLASSES):
+        head = node.find("div", "pos-header dpos-h") or node
+        title = node.find("div", "di-title")
+        prons = []
+        for pron in head.find_all("span", "pron dpron"):
+            area = pron.find_parent().find("span", "region dreg")
+            area_text = area.text + " " if area is not None else ""
+            prons.append(area_text + pron.text.strip().replace("/", "|"))
+
+        inflections = []
+        irreg = head.find("span", "irreg-infls dinfls")
+        if irreg is not None:
+            inflections = [i.text.strip() for i in irreg.find_all(class_="inf")]
+
+        entry["entries"].append({
+            "headword": title.text.strip() if title is not None else res_word,
+            "pos": [replace_all(i.text) for i in head.find_all("span", "pos dpos")],
+            "prons": prons,
+            "inflections": inflections,
+            "senses": extract_senses(node),
+        })
+
+    for block in first_dict.find_all("div", re.compile("xref synonyms? hax")):
+        entry["synonyms"].extend(get_item_texts(block))
+    for block in first_dict.find_all("div", re.compile("xref idioms? hax")):
+        entry["idioms"].extend(get_item_texts(block))
+    for block in first_dict.find_all("div", re.compile("xref phrasal_verbs? hax")):
+        entry["phrasal_verbs"].extend(get_item_texts(block))
+
+    return entry
 
 
 def parse_dict_head(block):
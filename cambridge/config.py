@@ -0,0 +1,80 @@
+"""
+Tunables read from environment variables, e.g. `CAMBRIDGE_CACHE_MAX_ENTRIES=5000 camb run`.
+"""
+
+import os
+
+from .log import logger
+
+
+def get_env(name, default, type=str):
+    value = os.environ.get(name)
+    if value is None or value == "":
+        return default
+
+    try:
+        return type(value)
+    except ValueError:
+        logger.warning(f'Ignored {name}="{value}", expecting {type.__name__}')
+        return default
+
+
+# Cache budget, 0 for unbounded
+CACHE_MAX_ENTRIES = get_env("CAMBRIDGE_CACHE_MAX_ENTRIES", 0, int)
+CACHE_MAX_MB = get_env("CAMBRIDGE_CACHE_MAX_MB", 0, float)
+
+# "lru" evicts the least recently looked up entries first, "lfu" the least often looked up ones
+CACHE_EVICTION = get_env("CAMBRIDGE_CACHE_EVICTION", "lru").lower()
+
+# New entries are written in one transaction once this many are pending, or this many seconds after the first one
+CACHE_BATCH_SIZE = get_env("CAMBRIDGE_CACHE_BATCH_SIZE", 20, int)
+CACHE_FLUSH_SECONDS = get_env("CAMBRIDGE_CACHE_FLUSH_SECONDS", 1.0, float)
+
+# Words not found, with the suggestions offered instead, are remembered this many hours, 0 to always ask the website
+CACHE_MISS_TTL_HOURS = get_env("CAMBRIDGE_CACHE_MISS_TTL_HOURS", 24, float)
+
+# With "camb -r", a cached entry older than this many hours is printed at once, then fetched again in the background
+CACHE_STALE_HOURS = get_env("CAMBRIDGE_CACHE_STALE_HOURS", 24 * 30, float)
+
+# "camb warm" fetches this many words at a time unless given -j
+WARM_CONCURRENCY = get_env("CAMBRIDGE_WARM_CONCURRENCY", 4, int)
+
+# A fixed User-Agent for every request; otherwise a pool of this many random ones is picked once per session and taken in turn
+USER_AGENT = get_env("CAMBRIDGE_USER_AGENT", "")
+USER_AGENT_POOL = get_env("CAMBRIDGE_USER_AGENT_POOL", 1, int)
+
+# One connection pool shared by all the lookups of a run: connections per host, how long idle ones stay open for reuse, how long resolved hosts are remembered
+HTTP_LIMIT_PER_HOST = get_env("CAMBRIDGE_HTTP_LIMIT_PER_HOST", 8, int)
+HTTP_KEEPALIVE_SECONDS = get_env("CAMBRIDGE_HTTP_KEEPALIVE_SECONDS", 30.0, float)
+HTTP_DNS_CACHE_SECONDS = get_env("CAMBRIDGE_HTTP_DNS_CACHE_SECONDS", 600, int)
+
+# Give up on a request after this many seconds in all, or this many to connect
+HTTP_TIMEOUT_SECONDS = get_env("CAMBRIDGE_HTTP_TIMEOUT_SECONDS", 5.0, float)
+HTTP_CONNECT_SECONDS = get_env("CAMBRIDGE_HTTP_CONNECT_SECONDS", 3.0, float)
+
+# A failed request is tried up to this many times in all, waiting a random time up to base * 2^n seconds, capped at max, before the n-th retry.
+# A run retries at most this many times in all, and skips a host for the cooldown seconds once it has failed this many times in a row.
+RETRY_ATTEMPTS = get_env("CAMBRIDGE_RETRY_ATTEMPTS", 3, int)
+RETRY_BASE_SECONDS = get_env("CAMBRIDGE_RETRY_BASE_SECONDS", 0.5, float)
+RETRY_MAX_SECONDS = get_env("CAMBRIDGE_RETRY_MAX_SECONDS", 8.0, float)
+RETRY_BUDGET = get_env("CAMBRIDGE_RETRY_BUDGET", 20, int)
+BREAKER_THRESHOLD = get_env("CAMBRIDGE_BREAKER_THRESHOLD", 5, int)
+BREAKER_COOLDOWN_SECONDS = get_env("CAMBRIDGE_BREAKER_COOLDOWN_SECONDS", 30.0, float)
+
+# While the suggestions for a word not found are shown, this many of the top ones are fetched, so the one chosen prints at once
+SUGGESTION_PREFETCH = get_env("CAMBRIDGE_SUGGESTION_PREFETCH", 3, int)
+
+# With "camb -H", Merriam-Webster is asked as well if Cambridge hasn't answered within this many seconds
+HEDGE_DELAY_SECONDS = get_env("CAMBRIDGE_HEDGE_DELAY_SECONDS", 1.0, float)
+
+# Save every page fetched into this directory, or serve the lookups from the pages saved there instead of the websites, see replay.py
+RECORD_DIR = get_env("CAMBRIDGE_RECORD_DIR", "")
+REPLAY_DIR = get_env("CAMBRIDGE_REPLAY_DIR", "")
+
+# Replayed pages answer after this many milliseconds, once more for a redirect, and are sent at this many KB/s, 0 for as fast as possible
+REPLAY_LATENCY_MS = get_env("CAMBRIDGE_REPLAY_LATENCY_MS", 0.0, float)
+REPLAY_BANDWIDTH_KBPS = get_env("CAMBRIDGE_REPLAY_BANDWIDTH_KBPS", 0.0, float)
+
+# Send each dictionary at most this many requests per second on average, 0 for no limit, allowing bursts of up to this many at once
+RATE_LIMIT = get_env("CAMBRIDGE_RATE_LIMIT", 4.0, float)
+RATE_BURST = get_env("CAMBRIDGE_RATE_BURST", 8, int)
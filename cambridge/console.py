@@ -1,3 +1,4 @@
+import asyncio
 import os
 import re
 
@@ -10,6 +11,9 @@ from typing import (
 
 JustifyMethod = Literal["left", "center", "right"]
 
+# Held while a word is printed, so words looked up at the same time are printed one after another
+print_lock = asyncio.Lock()
+
 Symbol = {
     "L_BRACKET" : "[",
     "R_BRACKET" : "]",
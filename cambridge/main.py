@@ -1,6 +1,6 @@
 async def main():
     try:
-        async with aiohttp.ClientSession() as session:
+        async with create_session() as session:
             args = parse_args(session)
             args_dict = vars(args) # transfrom namespace object into a dict
 
@@ -8,12 +8,19 @@ async def main():
                 logger.setLevel(logging.DEBUG)
                 logger.debug(args)
 
-            if args_dict.get("subparser_name") is not None and args_dict.get("subparser_name") == "l":
-                await list_words(args)
-            elif args_dict.get("subparser_name") is not None and args_dict.get("subparser_name") == "wod":
-                await wod(args)
-            else:
-                await search_word(args)
+            try:
+                if args_dict.get("subparser_name") is not None and args_dict.get("subparser_name") == "l":
+                    await list_words(args)
+                elif args_dict.get("subparser_name") is not None and args_dict.get("subparser_name") == "wod":
+                    await wod(args)
+                elif args_dict.get("subparser_name") is not None and args_dict.get("subparser_name") == "warm":
+                    await warm_words(args)
+                else:
+                    await search_word(args)
+            finally:
+                await wait_background()
+                cancel_warm_ups()
+                await close_stub()
 
     except asyncio.exceptions.CancelledError:
         print("Task cancelled.")
@@ -28,7 +35,8 @@ async def main():
     except SystemExit:
         pass
 
-    con.close()
+    await flush_cache()
+    close_cache()
 
 
 def run_on_term():
@@ -39,23 +47,25 @@ if __name__ == "__main__":
     import os
     import sys
     import asyncio
-    import aiohttp # type: ignore
     import logging
 
     sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
 
-    from cambridge.args import parse_args, search_word, list_words, wod
-    from cambridge.cache import con
+    from cambridge.args import parse_args, search_word, list_words, wod, warm_words
+    from cambridge.cache import flush_cache, close as close_cache
     from cambridge.log import logger
+    from cambridge.utils import wait_background, create_session, cancel_warm_ups
+    from cambridge.replay import close_stub
 
     asyncio.run(main())
 
 else:
     import sys
     import asyncio
-    import aiohttp # type: ignore
     import logging
 
-    from .args import parse_args, search_word, list_words, wod
-    from .cache import con
+    from .args import parse_args, search_word, list_words, wod, warm_words
+    from .cache import flush_cache, close as close_cache
     from .log import logger
+    from .utils import wait_background, create_session, cancel_warm_ups
+    from .replay import close_stub
@@ -0,0 +1,189 @@
+"""
+Recording the pages fetched, and serving them back from a local stub server, so lookups can be run and measured without the websites,
+e.g. `CAMBRIDGE_RECORD_DIR=fixtures camb hello` once, then `CAMBRIDGE_REPLAY_DIR=fixtures CAMBRIDGE_REPLAY_LATENCY_MS=200 camb -f hello`.
+"""
+
+import os
+import json
+import asyncio
+import hashlib
+from aiohttp import web # type: ignore
+from yarl import URL # type: ignore
+
+from .log import logger
+from .config import RECORD_DIR, REPLAY_DIR, REPLAY_LATENCY_MS, REPLAY_BANDWIDTH_KBPS
+
+
+# Not replayed as recorded: the body is saved decoded, and the stub server sets its own length and connection
+SKIPPED_HEADERS = {"content-encoding", "content-length", "transfer-encoding", "connection", "keep-alive"}
+
+# Not sent when recording, so the website answers with the page rather than a bodiless 304; the stub server answers them itself
+VALIDATOR_HEADERS = {"if-none-match", "if-modified-since"}
+
+CHUNK_SIZE = 16 * 1024
+
+
+class FixtureMissing(Exception):
+    pass
+
+
+class ReplayedResponse:
+    """A response of the stub server, telling the url it was recorded from, i.e. where the redirects ended, instead of the stub server's."""
+
+    def __init__(self, response, real_url):
+        self._response = response
+        self.url = self.real_url = URL(real_url)
+
+    def __getattr__(self, name):
+        return getattr(self._response, name)
+
+
+def is_on():
+    return bool(RECORD_DIR or REPLAY_DIR)
+
+
+def get_fixture_path(directory, url):
+    return os.path.join(directory, hashlib.sha1(url.encode("utf-8")).hexdigest())
+
+
+def save_fixture(directory, url, response, body):
+    os.makedirs(directory, exist_ok=True)
+    path = get_fixture_path(directory, url)
+    fixture = {
+        "url": url,
+        "real_url": str(response.real_url),
+        "status": response.status,
+        "headers": [[k, v] for k, v in response.headers.items() if k.lower() not in SKIPPED_HEADERS],
+    }
+    with open(path + ".body", "wb") as f:
+        f.write(body)
+    with open(path + ".json", "w", encoding="utf-8") as f:
+        json.dump(fixture, f, ensure_ascii=False, indent=2)
+    logger.debug(f"Recorded {url} with STATUS {response.status} into {path}.json")
+
+
+def load_fixture(directory, url):
+    path = get_fixture_path(directory, url)
+    try:
+        with open(path + ".json", encoding="utf-8") as f:
+            fixture = json.load(f)
+        with open(path + ".body", "rb") as f:
+            body = f.read()
+    except FileNotFoundError:
+        return None
+    return fixture, body
+
+
+def is_not_modified(request, recorded_headers):
+    """Whether the validators of the request match the recorded page, If-None-Match taking precedence as for the websites."""
+
+    etag = recorded_headers.get("etag")
+    if_none_match = request.headers.get("If-None-Match")
+    if if_none_match is not None:
+        return etag is not None and etag in [i.strip() for i in if_none_match.split(",")]
+
+    last_modified = recorded_headers.get("last-modified")
+    return last_modified is not None and request.headers.get("If-Modified-Since") == last_modified
+
+
+class StubServer:
+    """
+    Serve the fixtures of a directory on localhost, GET /?url=<recorded url>, after latency_ms for the request and each redirect it had,
+    sending the body at bandwidth_kbps (KB/s), 0 for as fast as possible. A request whose validators match the recorded page gets a 304.
+    """
+
+    def __init__(self, directory, latency_ms=0, bandwidth_kbps=0):
+        self.directory = directory
+        self.latency = latency_ms / 1000
+        self.bandwidth = bandwidth_kbps * 1024
+        self.runner = None
+        self.url = None
+
+    async def start(self):
+        app = web.Application()
+        app.router.add_get("/", self.handle)
+        self.runner = web.AppRunner(app, access_log=None)
+        await self.runner.setup()
+        await web.TCPSite(self.runner, "127.0.0.1", 0).start()
+        host, port = self.runner.addresses[0][ : 2]
+        self.url = f"http://{host}:{port}/"
+        logger.debug(f"Serving the fixtures of {self.directory} at {self.url}")
+
+    async def close(self):
+        if self.runner is not None:
+            await self.runner.cleanup()
+            self.runner = None
+
+    async def handle(self, request):
+        url = request.query.get("url", "")
+        loaded = load_fixture(self.directory, url)
+        if loaded is None:
+            return web.Response(status=404, headers={"X-Replay-Missing": "1"})
+
+        fixture, body = loaded
+        hops = 1 if fixture["real_url"] == url else 2
+        if self.latency:
+            await asyncio.sleep(self.latency * hops)
+
+        headers = [(k, v) for k, v in fixture["headers"]]
+        headers.append(("X-Replay-Url", fixture["real_url"]))
+        if fixture["status"] == 200 and is_not_modified(request, dict((k.lower(), v) for k, v in fixture["headers"])):
+            return web.Response(status=304, headers=headers)
+        response = web.StreamResponse(status=fixture["status"], headers=headers)
+        response.content_length = len(body)
+        await response.prepare(request)
+
+        try:
+            for i in range(0, len(body), CHUNK_SIZE):
+                chunk = body[i : i + CHUNK_SIZE]
+                await response.write(chunk)
+                if self.bandwidth:
+                    await asyncio.sleep(len(chunk) / self.bandwidth)
+            await response.write_eof()
+        # The client stopped reading, e.g. once it has the part of the page it wants
+        except ConnectionResetError:
+            pass
+        return response
+
+
+stub = None
+stub_lock = asyncio.Lock()
+
+
+async def get_stub():
+    global stub
+    async with stub_lock:
+        if stub is None:
+            if RECORD_DIR:
+                stub = StubServer(RECORD_DIR)
+            else:
+                stub = StubServer(REPLAY_DIR, REPLAY_LATENCY_MS, REPLAY_BANDWIDTH_KBPS)
+            await stub.start()
+    return stub
+
+
+async def close_stub():
+    global stub
+    if stub is not None:
+        await stub.close()
+        stub = None
+
+
+async def get(session, url, headers):
+    """
+    GET the url through the stub server. When recording, it's fetched from the website and saved first,
+    so what the lookup then reads is the same as when it's replayed, a 304 included if the cached copy is still the recorded one.
+    """
+
+    if RECORD_DIR:
+        live_headers = {k: v for k, v in headers.items() if k.lower() not in VALIDATOR_HEADERS}
+        async with session.get(url, headers=live_headers) as response:
+            body = await response.read()
+            save_fixture(RECORD_DIR, url, response, body)
+
+    server = await get_stub()
+    response = await session.get(server.url, params={"url": url}, headers=headers)
+    if "X-Replay-Missing" in response.headers:
+        response.release()
+        raise FixtureMissing(f"{url} is not recorded in {server.directory}")
+    return ReplayedResponse(response, response.headers["X-Replay-Url"])
@@ -1,12 +1,22 @@
 import sys
+import time
+import random
 import subprocess
 import asyncio
+import itertools
+import threading
+from collections import deque
 from urllib import parse
 from enum import Enum
+import aiohttp # type: ignore
+from lxml import etree # type: ignore
 from fake_user_agent import aio_user_agent # type: ignore
 
 from .log import logger
+from .config import USER_AGENT, USER_AGENT_POOL, HTTP_LIMIT_PER_HOST, HTTP_KEEPALIVE_SECONDS, HTTP_DNS_CACHE_SECONDS, HTTP_TIMEOUT_SECONDS, HTTP_CONNECT_SECONDS, \
+    RETRY_ATTEMPTS, RETRY_BASE_SECONDS, RETRY_MAX_SECONDS, RETRY_BUDGET, BREAKER_THRESHOLD, BREAKER_COOLDOWN_SECONDS, RATE_LIMIT, RATE_BURST, REPLAY_DIR
 from .console import c_print
+from . import replay
 
 from typing import Optional, Literal
 Initiator = Literal["wod_calendar", "spell_check", "cache_list", "redirect_list"]
@@ -27,7 +37,8 @@ class OP(Enum):
     UPDATED         = 12,
     SWITCHED        = 13,
     SEARCHING       = 14,
-    SELECTED        = 15
+    SELECTED        = 15,
+    REVALIDATING    = 16
 
 
 class DICT(Enum):
@@ -50,40 +61,345 @@ def quit_on_no_result(dict_name, is_spellcheck=False):
     sys.exit(1)
 
 
-def cancel_on_error(path, error, attempt, op):
-    attempt += 1
-    logger.debug(f"{op} {path} {attempt} times")
+class FetchError(Exception):
+    """Fetching a url failed for good, i.e. out of retries, or its host has been failing and is skipped for now."""
 
-    if attempt == 3:
-        print(f'Maximum {op} times reached.')
-        cancel_on_error_without_retry(path, error, op)
 
-    return attempt
+class RetryPolicy:
+    """Exponential backoff with full jitter, a retry budget shared by the whole run, and a circuit breaker per host."""
 
+    def __init__(self, attempts, base_delay, max_delay, budget, threshold, cooldown):
+        self.attempts = attempts
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self.budget = budget
+        self.threshold = threshold
+        self.cooldown = cooldown
+        self.failures = {}   # host -> consecutive failures
+        self.open_until = {} # host -> when requests to it are let through again
 
-def cancel_on_error_without_retry(path, error, op):
-    print(f'{op} on {path} failed: [{error.__class__.__name__}]')
+    def is_open(self, host):
+        return self.open_until.get(host, 0) > time.monotonic()
 
-    logger.debug(f"{OP.CANCELLING.name} task...")
-    task = asyncio.current_task()
-    task.cancel() # type: ignore
+    def succeeded(self, host):
+        self.failures.pop(host, None)
+        self.open_until.pop(host, None)
 
+    def failed(self, host):
+        self.failures[host] = self.failures.get(host, 0) + 1
+        if self.failures[host] >= self.threshold:
+            self.open_until[host] = time.monotonic() + self.cooldown
+            logger.debug(f"Skipping {host} for {self.cooldown}s after {self.failures[host]} failures in a row")
+
+    def next_delay(self, host, attempt):
+        """Seconds to wait before trying again after the attempt-th try failed, None to give up."""
+        if attempt >= self.attempts or self.budget <= 0 or self.is_open(host):
+            return None
+
+        self.budget -= 1
+        return random.uniform(0, min(self.max_delay, self.base_delay * 2 ** (attempt - 1)))
+
+
+retry_policy = RetryPolicy(RETRY_ATTEMPTS, RETRY_BASE_SECONDS, RETRY_MAX_SECONDS, RETRY_BUDGET, BREAKER_THRESHOLD, BREAKER_COOLDOWN_SECONDS)
+
+# Worth another try: throttled, or the server having a bad moment
+TRANSIENT_STATUSES = {429, 500, 502, 503, 504}
+
+
+class TokenBucket:
+    """Let through rate requests per second on average, and up to burst at once after a quiet while; the others wait their turn."""
+
+    def __init__(self, rate, burst):
+        self.rate = rate
+        self.burst = max(burst, 1)
+        self.tokens = self.burst
+        self.updated = time.monotonic()
+        self.lock = asyncio.Lock()
+        self.sent = deque() # when the requests of the last few seconds were let through, for logging the actual rate
+
+    async def acquire(self):
+        async with self.lock:
+            now = time.monotonic()
+            self.tokens = min(self.burst, self.tokens + (now - self.updated) * self.rate)
+            self.updated = now
+            if self.tokens < 1:
+                await asyncio.sleep((1 - self.tokens) / self.rate)
+                self.tokens = 1
+                self.updated = now = time.monotonic()
+            self.tokens -= 1
+
+            self.sent.append(now)
+            while self.sent[0] < now - 5:
+                self.sent.popleft()
+
+    def current_rate(self):
+        if len(self.sent) < 2:
+            return 0.0
+        return (len(self.sent) - 1) / max(self.sent[-1] - self.sent[0], 0.001)
+
+
+buckets = {} # host -> TokenBucket
+
+
+async def wait_for_rate_limit(host):
+    if RATE_LIMIT <= 0:
+        return
+
+    bucket = buckets.setdefault(host, TokenBucket(RATE_LIMIT, RATE_BURST))
+    await bucket.acquire()
+    logger.debug(f"Sending to {host} at {bucket.current_rate():.1f} requests/s, limited to {bucket.rate}/s")
+
+
+def get_host(url):
+    return parse.urlsplit(str(url)).netloc
+
+
+def is_failing(url):
+    """Whether the host of the url has failed repeatedly and is skipped for now."""
+    return retry_policy.is_open(get_host(url))
+
+
+def create_session():
+    connector = aiohttp.TCPConnector(
+        limit_per_host=HTTP_LIMIT_PER_HOST,
+        keepalive_timeout=HTTP_KEEPALIVE_SECONDS,
+        ttl_dns_cache=HTTP_DNS_CACHE_SECONDS,
+        ssl=False,
+    )
+    timeout = aiohttp.ClientTimeout(total=HTTP_TIMEOUT_SECONDS, connect=HTTP_CONNECT_SECONDS)
+    return aiohttp.ClientSession(connector=connector, timeout=timeout)
+
+
+# Connections being opened ahead of the first request to their host, by host
+warm_ups = {}
+
+
+async def warm_up(session, url):
+    try:
+        async with session.head(url, headers={"User-Agent": await get_user_agent()}, allow_redirects=False):
+            logger.debug(f"Warmed up the connection to {url}")
+    except Exception as error:
+        logger.debug(f"Warming up the connection to {url} failed: [{error.__class__.__name__}] {error}")
+
+
+def start_warm_up(session, url):
+    """
+    Resolve the host and open a connection to it in the background, which a fetch from the host reuses if it's ready by then.
+    Fetches don't wait for it, a lookup opens its own connection rather than queue behind a request it doesn't need.
+    """
+    host = get_host(url)
+    if REPLAY_DIR or host in warm_ups:
+        return
+    warm_ups[host] = asyncio.create_task(warm_up(session, url))
+
+
+def cancel_warm_ups():
+    for task in warm_ups.values():
+        task.cancel()
+    warm_ups.clear()
+
+
+# Loaded once per session by the first fetch, which the concurrent ones wait for
+user_agents = None
+
+
+async def load_user_agents():
+    uas = [await aio_user_agent() for _ in range(max(USER_AGENT_POOL, 1))]
+    logger.debug(f"Got User-Agents: {uas}")
+    return itertools.cycle(uas)
+
+
+async def get_user_agent():
+    global user_agents
+    if USER_AGENT:
+        return USER_AGENT
+
+    # Replayed pages don't need one, and the random ones may not be reachable offline
+    if REPLAY_DIR:
+        return "cambridge"
+
+    if user_agents is None:
+        user_agents = asyncio.ensure_future(load_user_agents())
+    # Shielded, so a lookup cancelled meanwhile doesn't cancel the loading for the others
+    return next(await asyncio.shield(user_agents))
+
+
+async def fetch(session, url, validators=(None, None)):
+    """GET the url; with the (etag, last_modified) of a cached copy, an unchanged page comes back as a bodiless 304."""
+
+    host = get_host(url)
+    ua = await get_user_agent()
 
-async def fetch(session, url):
-    attempt = 0
-    ua = await aio_user_agent()
-    logger.debug(f"Got User-Agent: {ua}")
     logger.debug(f"{OP.FETCHING.name} {url}")
+
+    headers = {"User-Agent": ua}
+    etag, last_modified = validators
+    if etag is not None:
+        headers["If-None-Match"] = etag
+    if last_modified is not None:
+        headers["If-Modified-Since"] = last_modified
+
+    attempt = 0
     while True:
+        if retry_policy.is_open(host):
+            raise FetchError(f"{OP.FETCHING.name} {url} skipped: {host} has been failing")
+
+        attempt += 1
+        await wait_for_rate_limit(host)
+        try:
+            resp = await replay.get(session, url, headers) if replay.is_on() else await session.get(url, headers=headers)
+        except replay.FixtureMissing as error:
+            raise FetchError(f"{OP.FETCHING.name} {url} failed: {error}") from error
+        except Exception as error:
+            reason = f"[{error.__class__.__name__}] {error}"
+        else:
+            if resp.status not in TRANSIENT_STATUSES:
+                retry_policy.succeeded(host)
+                return resp
+            resp.release()
+            reason = f"STATUS {resp.status}"
+
+        retry_policy.failed(host)
+        delay = retry_policy.next_delay(host, attempt)
+        if delay is None:
+            raise FetchError(f"{OP.FETCHING.name} {url} failed: {reason}")
+
+        logger.debug(f"{OP.RETRY_FETCHING.name} {url} in {delay:.2f}s, try {attempt} failed: {reason}")
+        await asyncio.sleep(delay)
+
+
+async def read_text(response):
+    """Read the body of a fetched response; a broken one counts as a failure of its host, but isn't retried as the stream is gone."""
+    try:
+        return await response.text()
+    except Exception as error:
+        retry_policy.failed(get_host(response.url))
+        raise FetchError(f"{OP.FETCHING.name} {response.url} failed: [{error.__class__.__name__}] {error}") from error
+
+
+class HtmlStream:
+    """
+    Parse a response body while it arrives. Iterating yields each element that is_element(element) holds for as soon as it has closed,
+    and reading stops once the first element that is_target(element) holds for has closed, e.g. the dictionary part of a page, leaving out footers and scripts.
+    Afterwards root and text are the tree parsed and the text read so far.
+    """
+
+    def __init__(self, response, is_target=None, is_element=None, chunk_size=16 * 1024):
+        self.response = response
+        self.is_target = is_target
+        self.is_element = is_element
+        self.chunk_size = chunk_size
+        self.root = None
+        self.text = ""
+
+    async def __aiter__(self):
+        response = self.response
+        parser = etree.HTMLPullParser(events=("start", "end"), remove_comments=True, encoding=response.charset or "utf-8")
+        chunks = []
+        target = None
+        is_done = False
         try:
-            resp = await session.get(url, headers={"User-Agent": ua}, timeout=5, ssl=False)
-        except asyncio.TimeoutError as error:
-            attempt = cancel_on_error(url, error, attempt, OP.FETCHING.name)
-            continue
+            async for chunk in response.content.iter_chunked(self.chunk_size):
+                chunks.append(chunk)
+                parser.feed(chunk)
+                for event, element in parser.read_events():
+                    if event == "start":
+                        if target is None and self.is_target is not None and self.is_target(element):
+                            target = element
+                        continue
+
+                    if self.is_element is not None and self.is_element(element):
+                        yield element
+                    if element is target:
+                        is_done = True
+                        break
+                if is_done:
+                    break
         except Exception as error:
-            cancel_on_error_without_retry(url, error, OP.FETCHING.name) # NO break!
+            retry_policy.failed(get_host(response.url))
+            raise FetchError(f"{OP.FETCHING.name} {response.url} failed: [{error.__class__.__name__}] {error}") from error
+
+        if is_done:
+            # The rest of the body is never read, so the connection can't be reused
+            response.close()
+            logger.debug(f"Stopped reading {response.url} after {sum(len(i) for i in chunks)} bytes")
+
+        try:
+            self.root = parser.close()
+        except etree.XMLSyntaxError:
+            # An empty body
+            self.root = None
+        self.text = b"".join(chunks).decode(response.charset or "utf-8", errors="replace")
+
+
+async def read_html_until(response, is_target):
+    """Return the tree parsed and the text read of a response body, downloaded up to the end of the first element that is_target(element) holds for."""
+    stream = HtmlStream(response, is_target)
+    async for _ in stream:
+        pass
+    return stream.root, stream.text
+
+
+def get_validators(response):
+    return response.headers.get("ETag"), response.headers.get("Last-Modified")
+
+
+# Tasks outliving the command that started them, e.g. revalidating a cached entry after printing it, awaited by main() before closing the session
+background_tasks = set()
+
+
+def run_in_background(coro):
+    task = asyncio.create_task(coro)
+    background_tasks.add(task)
+    task.add_done_callback(background_tasks.discard)
+
+
+async def wait_background():
+    while background_tasks:
+        await asyncio.gather(*background_tasks, return_exceptions=True)
+
+
+def cancel_tasks(tasks):
+    for task in tasks:
+        if task.done():
+            # Retrieved, so a failed one isn't reported as never retrieved
+            if not task.cancelled():
+                task.exception()
+        else:
+            task.cancel()
+
+
+async def run_in_thread(func, *args):
+    """
+    Run a blocking call, e.g. a prompt, in a thread while the event loop goes on.
+    Unlike asyncio.to_thread(), the thread is a daemon, so quitting with Ctrl-C doesn't wait for the prompt to return.
+    """
+
+    loop = asyncio.get_running_loop()
+    future = loop.create_future()
+
+    def set_result(result, error):
+        if future.done():
+            return
+        if error is None:
+            future.set_result(result)
         else:
-            return resp
+            future.set_exception(error)
+
+    def run():
+        result, error = None, None
+        try:
+            result = func(*args)
+        except BaseException as e:
+            error = e
+        try:
+            loop.call_soon_threadsafe(set_result, result, error)
+        except RuntimeError:
+            # The loop has been closed meanwhile
+            pass
+
+    threading.Thread(target=run, daemon=True).start()
+    return await future
 
 
 def replace_all(string):
@@ -242,16 +558,20 @@ def get_cache_selection(data, method):
 
 def get_cache_selection_by_fzf(data):
     notice = "Select to print the word's meaning; [ESC] to quit out."
-    choices = ""
-    for i in data:
-        choices = choices + i[0] + "\n"
-    choices = choices.strip()
 
-    p1 = subprocess.Popen(["echo", choices], stdout=subprocess.PIPE, text=True)
-    p2 = subprocess.Popen(["fzf", "--layout=reverse", "--bind", "enter:accept-or-print-query", "--header", notice], stdin=p1.stdout, stdout=subprocess.PIPE, text=True)
-    select_word = p2.communicate()[0].strip("\n")
+    # Feed fzf while the rows are still being read, so that it shows up at once however large the cache is
+    p = subprocess.Popen(["fzf", "--layout=reverse", "--bind", "enter:accept-or-print-query", "--header", notice], stdin=subprocess.PIPE, stdout=subprocess.PIPE, text=True)
+    try:
+        for i in data:
+            p.stdin.write(i[0] + "\n") # type: ignore
+        p.stdin.close() # type: ignore
+    except BrokenPipeError: # fzf quit before reading all of them
+        pass
 
-    if p2.returncode == 0 and select_word != "":
+    select_word = p.stdout.read().strip("\n") # type: ignore
+    p.wait()
+
+    if p.returncode == 0 and select_word != "":
         return select_word
     else:
         sys.exit()
@@ -2,10 +2,11 @@ import sys
 import asyncio
 from lxml import etree # type: ignore
 
-from .console import c_print
-from .utils import fetch, get_request_url, decode_url, OP, DICT, has_tool, get_suggestion, get_suggestion_by_fzf, get_wod_selection, get_wod_selection_by_fzf, quit_on_no_result, cancel_on_error, cancel_on_error_without_retry, remove_extra_spaces
+from .console import c_print, print_lock
+from .utils import fetch, get_request_url, decode_url, OP, DICT, has_tool, get_suggestion, get_suggestion_by_fzf, get_wod_selection, get_wod_selection_by_fzf, quit_on_no_result, remove_extra_spaces, run_in_background, get_validators, get_dict_name_by_url, read_text, read_html_until, HtmlStream, is_failing, FetchError, cancel_tasks, run_in_thread
 from .log import logger
-from .cache import check_cache, save_to_cache, get_cache
+from .config import SUGGESTION_PREFETCH
+from .cache import check_cache, check_misses, save_to_cache, save_miss_to_cache, get_cache, save_entry_to_cache, is_stale, refresh_cache, get_cache_validators
 from . import camb
 from . import color as w_col
 
@@ -18,100 +19,233 @@ WEBSTER_WORD_OF_THE_DAY_URL_CALENDAR = WEBSTER_BASE_URL + "/word-of-the-day/cale
 parser = etree.HTMLParser(remove_comments=True)
 word_entries = []    # A page may have multiple word entries, e.g. "runaway" as noun, "runaway" as adjective, "run away" as verb
 
+def get_search_url(input_word):
+    return get_request_url(WEBSTER_DICT_BASE_URL, input_word, DICT.MERRIAM_WEBSTER.name)
+
+
 async def search_webster(session, input_word, is_fresh=False, no_suggestions=False, req_url=None):
     if req_url is None:
-        req_url = get_request_url(WEBSTER_DICT_BASE_URL, input_word, DICT.MERRIAM_WEBSTER.name)
+        req_url = get_search_url(input_word)
 
     if is_fresh:
-        await fresh_run(session, input_word, no_suggestions, req_url)
+        await fresh_run(session, input_word, no_suggestions, req_url, await check_cache(input_word, req_url))
     else:
         res_url = await check_cache(input_word, req_url)
         if res_url is None:
             logger.debug(f'{OP.NOT_FOUND.name} "{input_word}" in cache')
-            await fresh_run(session, input_word, no_suggestions, req_url)
+            suggestions = await check_misses(req_url)
+            if suggestions is None:
+                await fresh_run(session, input_word, no_suggestions, req_url)
+            else:
+                logger.debug(f'{OP.FOUND.name} the suggestions for "{input_word}" in cache')
+                await suggestion_run(session, input_word, no_suggestions, suggestions)
         elif DICT.CAMBRIDGE.name.lower() in res_url:
             await camb.cache_run(res_url)
         else:
             await cache_run(res_url)
 
 
-async def cache_run(res_url_from_cache):
-    res_word, res_text = await get_cache(res_url_from_cache)
+async def suggestion_run(session, input_word, no_suggestions, suggestions):
+    if no_suggestions:
+        sys.exit(-1)
+
+    if not suggestions:
+        quit_on_no_result(DICT.MERRIAM_WEBSTER.name, is_spellcheck=True)
+
+    # The network would sit idle while the user is choosing, so fetch the top suggestions meanwhile
+    prefetches = {i: asyncio.create_task(prefetch(session, i)) for i in suggestions[ : SUGGESTION_PREFETCH]}
+    try:
+        # One prompt at a time, and no other word printed under it, while the prefetches go on
+        async with print_lock:
+            logger.debug(f'{OP.PRINTING.name} out suggestions for "{input_word}"')
+            select_word = await run_in_thread(get_suggestion_by_fzf if has_tool("fzf") else get_suggestion, suggestions, DICT.MERRIAM_WEBSTER.name)
+        chosen = prefetches.pop(select_word, None)
+    finally:
+        cancel_tasks(prefetches.values())
+
+    if select_word == "":
+        logger.debug(f'{OP.SWITCHED.name} to {DICT.CAMBRIDGE.name}')
+        await camb.search_cambridge(session, input_word, True, False, no_suggestions, None)
+    else:
+        logger.debug(f'{OP.SELECTED.name} "{select_word}"')
+        entry = await camb.get_prefetched(chosen)
+        if entry is None:
+            await search_webster(session, select_word, False, no_suggestions, None)
+        else:
+            logger.debug(f'{OP.FOUND.name} "{select_word}" prefetched')
+            async with print_lock:
+                await print_and_cache(select_word, entry)
+
+
+async def prefetch(session, input_word):
+    """Fetch a suggestion that isn't cached yet, returning it as fetch_entry() does."""
+
+    req_url = get_search_url(input_word)
+    if await check_cache(input_word, req_url) is not None:
+        return None
+    return await fetch_entry(session, req_url)
+
+
+async def cache_run(res_url_from_cache, session=None):
+    """Print a cached entry; given the session, also revalidate it in the background if it is stale."""
+
+    res_word, res_text, res_entry, created_at = await get_cache(res_url_from_cache)
     logger.debug(f'{OP.FOUND.name} "{res_word}" from {DICT.MERRIAM_WEBSTER.name} in cache')
-    logger.debug(f"{OP.PARSING.name} {res_url_from_cache}")
+
+    if session is not None and is_stale(created_at):
+        logger.debug(f'{OP.REVALIDATING.name} {res_url_from_cache} cached at {created_at}')
+        run_in_background(revalidate(session, res_url_from_cache, res_word, res_text))
+
+    # Printed from the cleaned html, by the same printer as a fresh lookup, so a hit looks exactly like the page did
     first_dict = etree.HTML(res_text, parser)
-    await parse_and_print(first_dict, res_url_from_cache, new_line=False)
-    c_print(f'\n#[#757575]{OP.FOUND.name} "{res_word}" from {DICT.MERRIAM_WEBSTER.name} in cache. You can add "-f" to fetch the {DICT.CAMBRIDGE.name} dictionary')
+    async with print_lock:
+        await parse_and_print(first_dict, res_url_from_cache, new_line=False)
+        c_print(f'\n#[#757575]{OP.FOUND.name} "{res_word}" from {DICT.MERRIAM_WEBSTER.name} in cache. You can add "-f" to fetch the {DICT.CAMBRIDGE.name} dictionary')
+
+    # Cached before the entry models, which the inflection and definition indexes are built from
+    if res_entry is None:
+        await save_entry_to_cache(res_url_from_cache, extract_entry(first_dict, res_word))
+
+
+async def fresh_run(session, input_word, no_suggestions, req_url, cached_url=None):
+    """Look up the word afresh; if Merriam-Webster keeps failing, look it up in Cambridge instead."""
+
+    try:
+        await fresh_lookup(session, input_word, no_suggestions, req_url, cached_url)
+    except FetchError as error:
+        print(error)
+        if is_failing(WEBSTER_BASE_URL) and not is_failing(camb.CAMBRIDGE_URL):
+            c_print(f'#[#757575]{OP.SWITCHED.name} to {DICT.CAMBRIDGE.name} for "{input_word}"')
+            await camb.search_cambridge(session, input_word, False, False, no_suggestions, None)
+
 
+def is_left_content(element):
+    return element.get("id") == "left-content"
+
+
+# The parts parse_and_print picks, relative to each element as it is downloaded
+is_printable_part = etree.XPath("""
+    self::div[parent::*[@id="left-content"]][contains(@id, "-entry") or @id="phrases" or @id="synonyms" or @id="related-phrases" or @id="nearby-entries"] |
+    self::div[contains(@class,"on-web")][parent::div[contains(@class,"on-web-container")]/parent::div[@class="content-section-body"]/parent::div[@id="examples"]/parent::*[@id="left-content"]]
+    """)
+
+
+def is_printable(element):
+    return element.tag == "div" and len(is_printable_part(element)) != 0
+
+
+async def fetch_entry(session, req_url):
+    """Fetch the page of a word without printing it, returning (res_url, first_dict, validators), or None if the word isn't found."""
 
-async def fresh_run(session, input_word, no_suggestions, req_url):
     response = await fetch(session, req_url)
+    if response.status != 200:
+        # Unread, so give the connection back to the pool now rather than when the response is garbage collected
+        response.release()
+        return None
+
+    tree, _ = await read_html_until(response, is_left_content)
+    nodes = tree.xpath('//*[@id="left-content"]')
+    if len(nodes) == 0 or tree.xpath('//p[contains(@class,"partial")]'):
+        return None
+    return str(response.real_url), nodes[0], get_validators(response)
+
+
+async def print_and_cache(input_word, entry, echo=True):
+    """Print a page fetched by fetch_entry, unless echo is False, and cache it."""
+
+    res_url, first_dict, validators = entry
+    if echo:
+        await parse_and_print(first_dict, res_url)
+    await cache(first_dict, input_word, res_url, validators)
+
+
+async def fresh_lookup(session, input_word, no_suggestions, req_url, cached_url=None):
+    """Fetch and print the word; if it is cached at cached_url already, an unchanged page is printed from the cache."""
+
+    validators = (None, None)
+    if cached_url is not None and get_dict_name_by_url(cached_url) == DICT.MERRIAM_WEBSTER.name:
+        validators = await get_cache_validators(cached_url)
+
+    response = await fetch(session, req_url, validators)
     res_url = str(response.real_url)
+
+    if response.status == 304:
+        if res_url == cached_url:
+            logger.debug(f'{OP.FOUND.name} {cached_url} not modified')
+            await refresh_cache(cached_url, validators=get_validators(response))
+            await cache_run(cached_url)
+            return
+
+        # Validated against another page of the cache, e.g. the entry of a related word
+        response = await fetch(session, req_url)
+        res_url = str(response.real_url)
+
+    # Only the entries are used, printed as they arrive, unless it's an error page listing suggestions
     status = response.status
-    res_text = None
-    attempt = 0
-    while True:
-        try:
-            res_text = await response.text()
-        except asyncio.TimeoutError as error:
-            attempt = cancel_on_error(req_url, error, attempt, OP.FETCHING.name)
-            continue
-        # There is also a scenario that in the process of cancelling, while is still looping, leading to run coroutine with a closed session.
-        # If session is closed, and you go on connecting, ClientConnectionError will be throwed.
-        except Exception as error:
-            cancel_on_error_without_retry(req_url, error, OP.FETCHING.name)
-            break
-        else:
-            break
-
-    if res_text is not None:
-        tree = etree.HTML(res_text, parser)
-        if status == 404:
-            logger.debug(f'{OP.NOT_FOUND.name} "{input_word}" at {res_url}')
-
-            if no_suggestions:
-                sys.exit(-1)
-
-            logger.debug(f"{OP.PARSING.name} out suggestions at {res_url}")
-            suggestions = tree.xpath('//div[@class="row m-0"][1]/p[@class="col-6 col-md-4 spelling-suggestion-col "]/a/text()')
-            if len(suggestions) == 0:
-                quit_on_no_result(DICT.MERRIAM_WEBSTER.name, is_spellcheck=True)
-
-            logger.debug(f"{OP.PRINTING.name} out suggestions at {res_url}")
-            select_word = get_suggestion_by_fzf(suggestions, DICT.MERRIAM_WEBSTER.name) if has_tool("fzf") else get_suggestion(suggestions, DICT.MERRIAM_WEBSTER.name)
-            if select_word == "":
-                logger.debug(f'{OP.SWITCHED.name} to {DICT.CAMBRIDGE.name}')
-                await camb.search_cambridge(session, input_word, True, False, no_suggestions, None)
-            else:
-                logger.debug(f'{OP.SELECTED.name} "{select_word}"')
-                await search_webster(session, select_word, False, no_suggestions, None)
-
-        elif status == 200 and tree.xpath('//p[contains(@class,"partial")]'):
-            input_word = decode_url(res_url).split("/")[-1]
-            suggestions = tree.xpath('//h2[@class="hword"]/text() | //h2[@class="hword"]/span/text()')
-            logger.debug(f"{OP.PRINTING.name} out suggestions at {res_url}")
-            select_word = get_suggestion_by_fzf(suggestions, DICT.MERRIAM_WEBSTER.name) if has_tool("fzf") else get_suggestion(suggestions, DICT.MERRIAM_WEBSTER.name)
-            if select_word == "":
-                logger.debug(f'{OP.SWITCHED.name} to {DICT.CAMBRIDGE.name}')
-                await camb.search_cambridge(session, input_word, True, False, no_suggestions, None)
-            else:
-                logger.debug(f'{OP.SELECTED.name} "{select_word}"')
-                await search_webster(session, select_word, False, no_suggestions, None)
+    if status == 200:
+        stream = HtmlStream(response, is_left_content, is_printable)
+        is_printed = await stream_and_print(stream, res_url)
+        tree = stream.root
+    else:
+        tree, _ = await read_html_until(response, None)
 
-        elif status == 200:
-            logger.debug(f'{OP.FOUND.name} "{input_word}" in {DICT.MERRIAM_WEBSTER.name} at {res_url}')
+    if status == 404:
+        logger.debug(f'{OP.NOT_FOUND.name} "{input_word}" at {res_url}')
 
-            first_dict = tree.xpath('//*[@id="left-content"]')[0]
-            if first_dict is None:
-                quit_on_no_result(DICT.MERRIAM_WEBSTER.name, is_spellcheck=False)
+        logger.debug(f"{OP.PARSING.name} out suggestions at {res_url}")
+        suggestions = [str(i) for i in tree.xpath('//div[@class="row m-0"][1]/p[@class="col-6 col-md-4 spelling-suggestion-col "]/a/text()')]
+        # Cached even with no_suggestions, which suggestion_run() then quits on, so e.g. "camb warm" doesn't fetch the word again
+        await save_miss_to_cache(req_url, suggestions)
+        await suggestion_run(session, input_word, no_suggestions, suggestions)
 
-            async with asyncio.TaskGroup() as tg:
-                task1 = tg.create_task(parse_and_print(first_dict, res_url, new_line=True))
-                task2 = tg.create_task(cache(first_dict, input_word, res_url))
+    elif status == 200 and tree.xpath('//p[contains(@class,"partial")]'):
+        if no_suggestions:
+            sys.exit(-1)
 
-        else:
-            print(f'Something went wrong when fetching {req_url} with STATUS: {status}')
-            sys.exit(2)
+        input_word = decode_url(res_url).split("/")[-1]
+        suggestions = [str(i) for i in tree.xpath('//h2[@class="hword"]/text() | //h2[@class="hword"]/span/text()')]
+        await suggestion_run(session, input_word, no_suggestions, suggestions)
+
+    elif status == 200:
+        logger.debug(f'{OP.FOUND.name} "{input_word}" in {DICT.MERRIAM_WEBSTER.name} at {res_url}')
+
+        first_dict = tree.xpath('//*[@id="left-content"]')[0]
+        if first_dict is None:
+            quit_on_no_result(DICT.MERRIAM_WEBSTER.name, is_spellcheck=False)
+
+        if not is_printed:
+            async with print_lock:
+                await parse_and_print(first_dict, res_url, new_line=True)
+        await cache(first_dict, input_word, res_url, get_validators(response), res_url == cached_url)
+
+    else:
+        print(f'Something went wrong when fetching {req_url} with STATUS: {status}')
+        sys.exit(2)
+
+
+async def revalidate(session, res_url, res_word, res_text):
+    try:
+        response = await fetch(session, res_url, await get_cache_validators(res_url))
+        if response.status == 304:
+            await refresh_cache(res_url, validators=get_validators(response))
+            return
+        tree, _ = await read_html_until(response, is_left_content)
+    except FetchError as error:
+        logger.debug(f'{OP.CANCELLED.name} revalidating {res_url}: {error}')
+        return
+
+    nodes = tree.xpath('//*[@id="left-content"]') if response.status == 200 else []
+    if len(nodes) == 0:
+        logger.debug(f'{OP.CANCELLED.name} revalidating {res_url}: no entry found with STATUS {response.status}')
+        return
+
+    first_dict = nodes[0]
+    clean_text = remove_extra_spaces(etree.tostring(first_dict).decode('utf-8'))
+    if clean_text == res_text:
+        await refresh_cache(res_url, validators=get_validators(response))
+    else:
+        res_word = get_response_word(first_dict, res_word)
+        await refresh_cache(res_url, clean_text, extract_entry(first_dict, res_word), get_validators(response))
 
 
 async def parse_and_print(first_dict, res_url, new_line=True):
@@ -129,44 +263,123 @@ async def parse_and_print(first_dict, res_url, new_line=True):
 
     logger.debug(f"{OP.PRINTING.name} the parsed result of {res_url}")
     for node in nodes:
-        try:
-            attr = node.attrib["id"]
-        except KeyError:
-            attr = node.attrib["class"]
+        print_node(node)
 
-        if "-entry" in attr:
-            dictionary_entry(node)
+    if new_line:
+        print()
 
-        elif attr == "phrases":
-            phrases(node)
 
-        elif attr == "nearby-entries":
-            nearby_entries(node)
+async def stream_and_print(stream, res_url):
+    """Print each part of the entries as soon as it has been downloaded, and return whether there was any part to stream, not if the page only lists suggestions."""
 
-        elif attr == "synonyms":
-            synonyms(node)
+    is_printing = False
+    is_partial = False
+    try:
+        async for element in stream:
+            if is_partial:
+                continue
 
-        elif "on-web" in attr:
-            examples(node)
+            if not is_printing:
+                # A page of partial matches lists suggestions instead, and has the note before any entry
+                if element.xpath('//p[contains(@class,"partial")]'):
+                    is_partial = True
+                    continue
 
-        elif attr == "related-phrases":
-            related_phrases(node)
+                # Hold the terminal from the first part on, so other words looked up at the same time don't print in between
+                await print_lock.acquire()
+                is_printing = True
+                logger.debug(f"{OP.PRINTING.name} the parsed result of {res_url} as it arrives")
+
+            print_node(element)
+
+        if is_printing:
+            print()
+    finally:
+        if is_printing:
+            print_lock.release()
+
+    return is_printing
 
-    if new_line:
-        print()
 
+def print_node(node):
+    try:
+        attr = node.attrib["id"]
+    except KeyError:
+        attr = node.attrib["class"]
+
+    if "-entry" in attr:
+        dictionary_entry(node)
+
+    elif attr == "phrases":
+        phrases(node)
+
+    elif attr == "nearby-entries":
+        nearby_entries(node)
+
+    elif attr == "synonyms":
+        synonyms(node)
+
+    elif "on-web" in attr:
+        examples(node)
 
-async def cache(first_dict, input_word, res_url):
-    res_word = input_word
+    elif attr == "related-phrases":
+        related_phrases(node)
 
+
+def get_response_word(first_dict, input_word):
     # Response word within res_url is not same with what apppears on the web page. e.g. "set in stone"
     result = first_dict.xpath('//*[@id="left-content"]/div[contains(@id, "-entry-1")]/div[1]/div/div[1]/h1/text()') \
         or first_dict.xpath('//*[@id="left-content"]/div[contains(@id, "-entry-1")]/div[1]/div/div/h1/span/text()')
-    if len(result) != 0:
-        res_word = result[0]
+    return result[0] if len(result) != 0 else input_word
+
 
+async def cache(first_dict, input_word, res_url, validators=(None, None), is_cached=False):
+    res_word = get_response_word(first_dict, input_word)
     clean_text = remove_extra_spaces(etree.tostring(first_dict).decode('utf-8'))
-    await save_to_cache(input_word, res_word, res_url, clean_text)
+    entry = extract_entry(first_dict, res_word)
+    if is_cached:
+        await refresh_cache(res_url, clean_text, entry, validators)
+    else:
+        await save_to_cache(input_word, res_word, res_url, clean_text, entry, validators)
+
+
+def get_text(node):
+    return remove_extra_spaces("".join(node.itertext()))
+
+
+def extract_senses(node):
+    senses = []
+    for dt in node.xpath('.//span[@class="dtText"]'):
+        examples = [get_text(i) for i in dt.getparent().xpath('.//*[contains(@class, "ex-sent") and not(contains(@class, "aq has-aq"))]')]
+        senses.append({"definition": get_text(dt).lstrip(":").strip(), "examples": examples})
+    return senses
+
+
+def extract_entry(first_dict, res_word):
+    """Extract the parsed entry model of the page, which the inflection and definition indexes of the cache are built from."""
+
+    entry = {"word": res_word, "entries": [], "synonyms": [], "idioms": [], "phrasal_verbs": []}
+
+    for node in first_dict.xpath('//*[@id="left-content"]/div[contains(@id, "-entry")]'):
+        header = node.xpath('.//div[contains(@class, "entry-header-content")]')
+        headword = get_text(header[0].xpath('./h1 | ./p')[0]) if header and header[0].xpath('./h1 | ./p') else res_word
+        pos = [get_text(i) for i in header[0].xpath('./h2')] if header else []
+
+        entry["entries"].append({
+            "headword": headword,
+            "pos": pos,
+            "prons": [get_text(i) for i in node.xpath('.//span[contains(@class, "prons-entries-list-inline")]')],
+            "inflections": [i.strip() for i in node.xpath('.//span[@class="if"]/text()') if i.strip()],
+            "senses": extract_senses(node),
+        })
+
+        if any("phrasal verb" in p for p in pos):
+            entry["phrasal_verbs"].append(headword)
+
+    entry["synonyms"] = [get_text(i) for i in first_dict.xpath('//*[@id="synonyms"]//ul/li')]
+    entry["idioms"] = [get_text(i) for i in first_dict.xpath('//*[@id="phrases"]//*[@class="drp"]')]
+
+    return entry
 
 
 def examples(node):
@@ -1235,17 +1448,17 @@ async def parse_and_print_wod_calendar(session, res_url, res_text):
 
 async def get_webster_wod(session):
     resp = await fetch(session, WEBSTER_WORD_OF_THE_DAY_URL)
-    result = await resp.text()
+    result = await read_text(resp)
     parse_and_print_wod(resp.url, result)
 
 
 async def get_webster_wod_past(session, req_url):
     resp = await fetch(session, req_url)
-    result = await resp.text()
+    result = await read_text(resp)
     parse_and_print_wod(resp.url, result)
 
 
 async def get_webster_wod_list(session):
     resp = await fetch(session, WEBSTER_WORD_OF_THE_DAY_URL_CALENDAR)
-    result = await resp.text()
+    result = await read_text(resp)
     await parse_and_print_wod_calendar(session, resp.url, result)
@@ -0,0 +1,5 @@
+import os
+import tempfile
+
+# The cache opens its database under the home directory on import, so point it at a throwaway one
+os.environ["HOME"] = tempfile.mkdtemp(prefix="cambridge-tests-")
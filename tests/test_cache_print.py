@@ -0,0 +1,86 @@
+"""A cache hit prints the same as the fresh lookup that cached the page."""
+
+import asyncio
+import datetime
+from pathlib import Path
+
+import pytest
+from yarl import URL # type: ignore
+
+from cambridge import camb, webster
+
+PAGES = Path(__file__).parent / "pages"
+
+
+class FakeContent:
+    def __init__(self, body):
+        self.body = body
+
+    async def iter_chunked(self, size):
+        for i in range(0, len(self.body), size):
+            yield self.body[i : i + size]
+
+
+class FakeResponse:
+    status = 200
+    charset = "utf-8"
+    headers = {}
+
+    def __init__(self, url, body):
+        self.url = self.real_url = URL(url)
+        self.content = FakeContent(body)
+
+    def close(self):
+        pass
+
+    def release(self):
+        pass
+
+
+def look_up_and_hit(module, page, url, capsys, monkeypatch):
+    """Return what a fresh lookup of the page printed, and what a cache hit of what it cached printed."""
+
+    body = (PAGES / page).read_bytes()
+    cached = {}
+
+    async def fetch(session, req_url, validators=(None, None)):
+        return FakeResponse(url, body)
+
+    async def save_to_cache(input_word, res_word, res_url, text, entry, validators=(None, None)):
+        cached[res_url] = (res_word, text, entry, datetime.datetime.now())
+
+    async def get_cache(res_url):
+        return cached[res_url]
+
+    monkeypatch.setattr(module, "fetch", fetch)
+    monkeypatch.setattr(module, "save_to_cache", save_to_cache)
+    monkeypatch.setattr(module, "get_cache", get_cache)
+
+    if module is camb:
+        asyncio.run(camb.fresh_lookup(None, "rich", False, True, url))
+    else:
+        asyncio.run(webster.fresh_lookup(None, "run", True, url))
+    fresh = capsys.readouterr().out
+
+    asyncio.run(module.cache_run(next(iter(cached))))
+    hit = capsys.readouterr().out
+    return fresh, hit
+
+
+@pytest.mark.parametrize("module, page, url", [
+    (camb, "cambridge.html", "https://dictionary.cambridge.org/dictionary/english/rich"),
+    (webster, "webster.html", "https://www.merriam-webster.com/dictionary/run"),
+])
+def test_cache_hit_prints_as_fresh_lookup(module, page, url, capsys, monkeypatch):
+    fresh, hit = look_up_and_hit(module, page, url, capsys, monkeypatch)
+
+    # The fresh lookup ends with a blank line, where the hit tells it came from the cache
+    assert fresh.strip()
+    assert hit.startswith(fresh)
+
+
+def test_cache_hit_keeps_labels_phrases_and_xrefs(capsys, monkeypatch):
+    _, hit = look_up_and_hit(camb, "cambridge.html", "https://dictionary.cambridge.org/dictionary/english/rich", capsys, monkeypatch)
+
+    for text in ["finance", "[informal]", "[UK]", "rich in sth", "SEE ALSO", "nouveau riche"]:
+        assert text in hit